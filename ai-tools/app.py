@@ -1,38 +1,252 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 import base64
-from io import BytesIO
-from PIL import Image
+import json
+import multiprocessing
+import os
 import tools
+import images
+import models
+import metrics
+from scheduler import MicroBatcher
+from loader import ToolManager
+from cache import ResultCache, content_key
+import workers
 
 app = Flask(__name__)
 CORS(app)
 
-# Initialize all tools at startup
+# Request and stage timings at /metrics; set AI_TOOLS_METRICS=0 to turn them off
+metrics.init_app(app, 'ai_tools', os.environ.get('AI_TOOLS_METRICS', '1') != '0')
+app.config['BATCH_MAX_SIZE'] = 16  # most inputs in one batched model call
+app.config['BATCH_MAX_WAIT'] = 0.01  # seconds a request waits for others to join its batch
+app.config['BATCH_TIMEOUT'] = 300  # seconds a request waits for its batch's result
+app.config['REQUEST_BATCH_SIZE'] = 32  # default inputs per model call for /api/process-batch
+app.config['MAX_BATCH_INPUTS'] = 256  # most inputs in one /api/process-batch request
+
+# Uploads are rejected before decoding if they are too big, in bytes or in pixels
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('AI_TOOLS_MAX_UPLOAD_MB', 16)) * 1024 * 1024
+app.config['MAX_IMAGE_PIXELS'] = int(os.environ.get('AI_TOOLS_MAX_IMAGE_PIXELS', images.MAX_PIXELS))
+app.config['IMAGE_DECODE_SIZE'] = 224  # JPEGs are decoded at reduced scale down to about this
+
+# Model loading: AI_TOOLS_WARMUP is 1 (load every tool in the background at
+# startup), 0 (load each tool on first use) or a comma-separated list of tools.
+# Tools unused for AI_TOOLS_IDLE_TIMEOUT seconds are unloaded (0 keeps them).
+app.config['WARMUP'] = os.environ.get('AI_TOOLS_WARMUP', '1')
+app.config['TOOL_IDLE_TIMEOUT'] = float(os.environ.get('AI_TOOLS_IDLE_TIMEOUT', 30 * 60))
+
+# Results of the deterministic tools are cached by content. Set
+# AI_TOOLS_CACHE_PATH (e.g. results.db) to keep them across restarts.
+app.config['CACHED_TOOLS'] = {'semantics', 'classifier'}
+app.config['RESULT_CACHE_SIZE'] = int(os.environ.get('AI_TOOLS_CACHE_SIZE', 1024))
+app.config['RESULT_CACHE_PATH'] = os.environ.get('AI_TOOLS_CACHE_PATH')
+
+# CPU backend per tool (torch, int8 or onnx; see models.py), e.g.
+# AI_TOOLS_BACKENDS=semantics=onnx,classifier=int8. The haiku, quest and
+# explainer tools only share one model if they use the same backend.
+app.config['BACKENDS'] = dict(item.split('=', 1) for item in
+                              os.environ.get('AI_TOOLS_BACKENDS', '').split(',') if '=' in item)
+
+for tool_name, tool_backend in app.config['BACKENDS'].items():
+    if tool_backend not in models.BACKENDS:
+        raise ValueError(f"Unknown backend {tool_backend!r} for {tool_name}; "
+                         f"choose from {', '.join(models.BACKENDS)}")
+
+def backend(name):
+    return app.config['BACKENDS'].get(name, 'torch')
+
 tool_instances = {
-    'semantics': tools.SemanticsAnalyzer(),
-    'classifier': tools.ImageClassifier(),
-    # 'summarizer': tools.TextSummarizer(),
-    'quest': tools.RPGQuestGenerator(),
-    'haiku': tools.HaikuWriter(),
-    'explainer': tools.WhyExplainer()
+    'semantics': tools.SemanticsAnalyzer(backend('semantics')),
+    'classifier': tools.ImageClassifier(backend('classifier')),
+    # 'summarizer': tools.TextSummarizer(backend('summarizer')),
+    'quest': tools.RPGQuestGenerator(backend('quest')),
+    'haiku': tools.HaikuWriter(backend('haiku')),
+    'explainer': tools.WhyExplainer(backend('explainer'))
+}
+
+# With AI_TOOLS_WORKERS=1 the models run in separate worker processes, one
+# pool per group of tools. Each pool has its own processes and torch
+# threads, and each tool a limit on how many of its requests run at once.
+app.config['WORKERS'] = os.environ.get('AI_TOOLS_WORKERS', '0') == '1'
+app.config['WORKER_GROUPS'] = {
+    'classifiers': {'tools': ['semantics', 'classifier'], 'processes': 1, 'threads': 2},
+    'generative': {'tools': ['quest', 'haiku', 'explainer'], 'processes': 1, 'threads': 2},
+}
+app.config['TOOL_CONCURRENCY'] = {'semantics': 2, 'classifier': 2, 'quest': 1, 'haiku': 1, 'explainer': 1}
+app.config['MAX_WAITING'] = 64  # requests queued per tool before answering 503
+app.config['WORKER_TIMEOUT'] = float(os.environ.get('AI_TOOLS_WORKER_TIMEOUT', 300))  # seconds before a worker call fails
+
+# Models are loaded on first use (or by the warmup thread), not here
+manager = ToolManager(tool_instances, app.config['TOOL_IDLE_TIMEOUT'])
+
+# The debug reloader imports this file in a parent process that never serves
+# requests, and worker processes import it again as they start; only the
+# process that serves requests loads models or starts workers
+serving = (multiprocessing.current_process().name == 'MainProcess' and
+           (__name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'))
+
+pools = {}  # tool name -> the WorkerPool running it
+if app.config['WORKERS'] and serving:
+    for group, spec in app.config['WORKER_GROUPS'].items():
+        pool = workers.WorkerPool(
+            group, {name: (type(tool_instances[name]).__name__, tool_instances[name].backend)
+                    for name in spec['tools']},
+            spec['processes'], spec['threads'], app.config['TOOL_CONCURRENCY'],
+            app.config['MAX_WAITING'], app.config['WORKER_TIMEOUT'])
+        pools.update((name, pool) for name in spec['tools'])
+
+def call_tool(tool_name, method, arg):
+    """tool.<method>(arg), in a worker process or in this one"""
+    if tool_name in pools:
+        return pools[tool_name].call(tool_name, method, arg)
+    with manager.use(tool_name) as tool:
+        return getattr(tool, method)(arg)
+
+def stream_tool(tool_name, arg):
+    if tool_name in pools:
+        yield from pools[tool_name].stream(tool_name, arg)
+        return
+    with manager.use(tool_name) as tool:
+        yield from tool.stream_query(arg)
+
+def tool_status():
+    """{name: {'loaded', 'error', ...}} for every tool, wherever it runs"""
+    if not pools:
+        return manager.status()
+    return {name: {'loaded': name in pool.loaded, 'error': pool.errors.get(name),
+                   'waiting': pool.waiting[name], 'running': pool.running[name]}
+            for name, pool in pools.items()}
+
+if app.config['WARMUP'] == '1':
+    warmup_tools = list(tool_instances)
+elif app.config['WARMUP'] == '0':
+    warmup_tools = []
+else:
+    warmup_tools = [name.strip() for name in app.config['WARMUP'].split(',')
+                    if name.strip() in tool_instances]
+
+def batch_runner(name):
+    def process_batch(items):
+        return call_tool(name, 'process_batch', items)
+    return process_batch
+
+# Concurrent requests to tools that can batch are grouped into one model call;
+# each tool runs up to its TOOL_CONCURRENCY batches at once
+schedulers = {
+    name: MicroBatcher(name, batch_runner(name), app.config['BATCH_MAX_SIZE'],
+                       app.config['BATCH_MAX_WAIT'], app.config['TOOL_CONCURRENCY'].get(name, 1),
+                       app.config['MAX_WAITING'])
+    for name, tool in tool_instances.items() if hasattr(tool, 'process_batch')
 }
 
-# Initialize models for all tools
-print("🚀 Initializing AI models...")
-for name, tool in tool_instances.items():
-    print(f"  Loading {name}...")
-    tool.init_model()
-print("✅ All models ready!")
+image_tools = {'classifier'}
+
+def decode_image(data):
+    with metrics.timer('decode_image'):
+        return images.decode(data, app.config['IMAGE_DECODE_SIZE'], app.config['MAX_IMAGE_PIXELS'])
+
+result_cache = ResultCache(app.config['RESULT_CACHE_SIZE'], app.config['RESULT_CACHE_PATH'])
+
+def cache_key(tool_name, query):
+    # Backends can give slightly different scores, so they don't share entries
+    return content_key(f'{tool_name}:{tool_instances[tool_name].backend}', query)
+
+def run_tool(tool_name, query):
+    key = None
+    if tool_name in app.config['CACHED_TOOLS']:
+        with metrics.timer('cache_lookup'):
+            key = cache_key(tool_name, query)
+            result = result_cache.get(key)
+        metrics.inc('result_cache_hits_total' if result is not None else 'result_cache_misses_total',
+                    tool=tool_name)
+        if result is not None:
+            return result
+    
+    if tool_name in schedulers:
+        result = schedulers[tool_name](query, app.config['BATCH_TIMEOUT'])
+    else:
+        result = call_tool(tool_name, 'process_query', query)
+    
+    if key is not None:
+        result_cache.set(key, result)
+    return result
+
+def run_batch(tool_name, queries, batch_size):
+    """Results for all the queries, in order, running the uncached ones `batch_size` at a time"""
+    results = [None] * len(queries)
+    keys = [None] * len(queries)
+    if tool_name in app.config['CACHED_TOOLS']:
+        with metrics.timer('cache_lookup'):
+            for i, query in enumerate(queries):
+                keys[i] = cache_key(tool_name, query)
+                results[i] = result_cache.get(keys[i])
+        hits = sum(result is not None for result in results)
+        metrics.inc('result_cache_hits_total', hits, tool=tool_name)
+        metrics.inc('result_cache_misses_total', len(queries) - hits, tool=tool_name)
+    
+    todo = [i for i, result in enumerate(results) if result is None]
+    for start in range(0, len(todo), batch_size):
+        chunk = todo[start:start + batch_size]
+        if tool_name in schedulers:
+            outputs = call_tool(tool_name, 'process_batch', [queries[i] for i in chunk])
+        else:
+            outputs = [call_tool(tool_name, 'process_query', queries[i]) for i in chunk]
+        metrics.inc('request_batches_total', tool=tool_name)
+        for i, output in zip(chunk, outputs):
+            results[i] = output
+            if keys[i] is not None:
+                result_cache.set(keys[i], output)
+    return results
+
+metrics.collect('queue_depth', lambda: {(('tool', name),): s.queue_depth()
+                                        for name, s in schedulers.items()},
+                help='Requests waiting for a batch, by tool')
+metrics.collect('model_handles', lambda: {(('task', task), ('model', model), ('backend', backend)): refs
+                                          for (task, model, backend), refs in models.loaded().items()},
+                help='Tools sharing each loaded model')
+metrics.collect('tool_loaded', lambda: {(('tool', name),): int(status['loaded'])
+                                        for name, status in tool_status().items()},
+                help='1 if the tool\'s model is loaded')
+metrics.collect('worker_waiting', lambda: {(('tool', name),): pool.waiting[name]
+                                           for name, pool in pools.items()},
+                help='Requests waiting for a worker, by tool')
+metrics.collect('worker_running', lambda: {(('tool', name),): pool.running[name]
+                                           for name, pool in pools.items()},
+                help='Requests running in a worker, by tool')
+metrics.collect('result_cache_entries', lambda: len(result_cache),
+                help='Results in the inference cache')
+
+# Worker processes load their own tools as they start
+if serving and not pools:
+    if warmup_tools:
+        print(f"🚀 Warming up {', '.join(warmup_tools)} in the background...")
+        manager.warmup(warmup_tools)
+    if app.config['TOOL_IDLE_TIMEOUT']:
+        manager.start_reaper()
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/api/ready')
+def ready():
+    """Which tools are loaded; 503 until every warmup tool is"""
+    status = tool_status()
+    # Workers always load every tool at startup
+    is_ready = all(status[name]['loaded'] for name in (list(pools) or warmup_tools))
+    return jsonify({'ready': is_ready, 'tools': status}), 200 if is_ready else 503
+
+@app.route('/api/cache-stats')
+def cache_stats():
+    """Size and hit rate of the inference result cache"""
+    return jsonify(result_cache.stats())
+
 @app.route('/api/process', methods=['POST'])
 def process():
     try:
-        data = request.json
+        with metrics.timer('parse'):
+            data = request.json
         tool_name = data.get('tool')
         input_type = data.get('type')  # 'text' or 'image'
         content = data.get('content')
@@ -40,23 +254,143 @@ def process():
         if tool_name not in tool_instances:
             return jsonify({'error': 'Unknown tool or tool not initialized'}), 400
         
-        tool = tool_instances[tool_name]
-        
         # Process based on input type
         if input_type == 'image':
-            # Decode base64 image
-            image_data = base64.b64decode(content.split(',')[1])
-            image = Image.open(BytesIO(image_data))
-            # Ensure image is loaded and in RGB mode
-            image = image.convert('RGB')
-            result = tool.process_query(image)
+            # Decode base64 image (a data URL); /api/upload avoids the base64 overhead
+            image = decode_image(base64.b64decode(content.split(',')[1]))
+            with metrics.timer('inference', tool=tool_name):
+                result = run_tool(tool_name, image)
+        else:
+            with metrics.timer('inference', tool=tool_name):
+                result = run_tool(tool_name, content)
+        
+        with metrics.timer('serialize'):
+            return jsonify({'result': result})
+    
+    except (RequestEntityTooLarge, images.ImageTooLarge) as e:
+        return jsonify({'error': str(e)}), 413
+    except images.InvalidImage as e:
+        return jsonify({'error': str(e)}), 400
+    except workers.Busy as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/process-batch', methods=['POST'])
+def process_batch():
+    """Run a tool on a list of inputs in one request
+    
+    Takes the same JSON as /api/process, but with 'contents' (a list) in
+    place of 'content', and optionally 'batch_size', the number of inputs
+    per model call. Answers {"results": [...]} in the same order.
+    """
+    try:
+        with metrics.timer('parse'):
+            data = request.json
+        tool_name = data.get('tool')
+        input_type = data.get('type')  # 'text' or 'image'
+        contents = data.get('contents')
+        batch_size = data.get('batch_size', app.config['REQUEST_BATCH_SIZE'])
+        
+        if tool_name not in tool_instances:
+            return jsonify({'error': 'Unknown tool or tool not initialized'}), 400
+        if not isinstance(contents, list) or not contents:
+            return jsonify({'error': "'contents' must be a non-empty list"}), 400
+        if len(contents) > app.config['MAX_BATCH_INPUTS']:
+            return jsonify({'error': f"At most {app.config['MAX_BATCH_INPUTS']} inputs per request"}), 413
+        if not isinstance(batch_size, int) or batch_size < 1:
+            return jsonify({'error': "'batch_size' must be a positive integer"}), 400
+        
+        if input_type == 'image':
+            queries = [decode_image(base64.b64decode(content.split(',')[1])) for content in contents]
         else:
-            result = tool.process_query(content)
+            queries = contents
         
-        return jsonify({'result': result})
+        with metrics.timer('inference', tool=tool_name):
+            results = run_batch(tool_name, queries, batch_size)
+        
+        with metrics.timer('serialize'):
+            return jsonify({'results': results})
+    
+    except (RequestEntityTooLarge, images.ImageTooLarge) as e:
+        return jsonify({'error': str(e)}), 413
+    except images.InvalidImage as e:
+        return jsonify({'error': str(e)}), 400
+    except workers.Busy as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/upload', methods=['POST'])
+def upload():
+    """Run an image tool on an uploaded image file, without base64 encoding it
+    
+    Takes multipart/form-data with the image in a 'file' field and a 'tool'
+    field, or the raw image bytes as the body with ?tool=classifier.
+    Answers like /api/process.
+    """
+    try:
+        tool_name = request.values.get('tool', 'classifier')
+        if tool_name not in image_tools:
+            return jsonify({'error': f'{tool_name} does not take images'}), 400
+        
+        with metrics.timer('parse'):
+            file = request.files.get('file')
+            data = file.read() if file else request.get_data()
+        if not data:
+            return jsonify({'error': 'No image given'}), 400
+        
+        image = decode_image(data)
+        with metrics.timer('inference', tool=tool_name):
+            result = run_tool(tool_name, image)
+        
+        with metrics.timer('serialize'):
+            return jsonify({'result': result})
     
+    except (RequestEntityTooLarge, images.ImageTooLarge) as e:
+        return jsonify({'error': str(e)}), 413
+    except images.InvalidImage as e:
+        return jsonify({'error': str(e)}), 400
+    except workers.Busy as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def sse(event, data):
+    """One Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/api/stream', methods=['GET', 'POST'])
+def stream():
+    """Stream a generative tool's answer as Server-Sent Events while it is generated
+
+    Takes the same JSON as /api/process (or tool and content query parameters,
+    for EventSource). Sends 'token' events with {"text": ...}, then 'done',
+    or 'error' with {"error": ...}.
+    """
+    data = request.get_json(silent=True) or request.args
+    tool_name = data.get('tool')
+    content = data.get('content')
+    
+    if tool_name not in tool_instances:
+        return jsonify({'error': 'Unknown tool or tool not initialized'}), 400
+    if not hasattr(tool_instances[tool_name], 'stream_query'):
+        return jsonify({'error': f'{tool_name} does not support streaming'}), 400
+    if not content:
+        return jsonify({'error': 'No content given'}), 400
+    
+    def generate():
+        try:
+            with metrics.timer('stream', tool=tool_name):
+                for text in stream_tool(tool_name, content):
+                    yield sse('token', {'text': text})
+            yield sse('done', {})
+        except Exception as e:
+            yield sse('error', {'error': str(e)})
+    
+    # No buffering by proxies, so each token reaches the browser straight away
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,65 @@
+"""
+Throughput of the sentiment analyzer at different batch sizes
+
+Runs the same texts through SemanticsAnalyzer.process_batch (the call behind
+/api/process-batch) in batches of 1, 2, 4, ... 64 and reports texts per
+second, to help choose REQUEST_BATCH_SIZE and BATCH_MAX_SIZE.
+
+Usage:
+    python benchmark_batch.py
+    python benchmark_batch.py --sizes 1 8 32 --texts 256 --backend int8
+    python benchmark_batch.py --json batch.json
+"""
+import argparse
+import json
+import time
+
+import models
+import tools
+from compare_backends import TEXTS
+
+
+def run(analyzer, texts, batch_size):
+    """Seconds to score all the texts, batch_size at a time"""
+    start = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        analyzer.process_batch(texts[i:i + batch_size])
+    return time.perf_counter() - start
+
+
+def benchmark(sizes, n_texts, backend, repeats):
+    texts = [TEXTS[i % len(TEXTS)] for i in range(n_texts)]
+    analyzer = tools.SemanticsAnalyzer(backend)
+    analyzer.init_model()
+    rows = []
+    try:
+        run(analyzer, texts[:max(sizes)], max(sizes))  # warm up
+        for batch_size in sizes:
+            seconds = min(run(analyzer, texts, batch_size) for _ in range(repeats))
+            rows.append({'batch_size': batch_size,
+                         'texts_per_s': round(n_texts / seconds, 1),
+                         'ms_per_text': round(seconds * 1000 / n_texts, 2)})
+    finally:
+        analyzer.unload_model()
+    base = rows[0]['texts_per_s']
+    for row in rows:
+        row['speedup'] = round(row['texts_per_s'] / base, 2) if base else None
+        speedup = f"{row['speedup']:5.2f}x" if row['speedup'] else '    -'
+        print(f"batch {row['batch_size']:>3}  {row['texts_per_s']:8.1f} texts/s  "
+              f"{row['ms_per_text']:7.2f} ms/text  speedup {speedup}")
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sentiment analysis throughput by batch size')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument('--texts', type=int, default=128, help='texts scored per run')
+    parser.add_argument('--backend', choices=models.BACKENDS, default='torch')
+    parser.add_argument('--repeats', type=int, default=3, help='runs per batch size; the fastest counts')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    rows = benchmark(args.sizes, args.texts, args.backend, args.repeats)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
@@ -0,0 +1,81 @@
+"""
+Result cache for the deterministic AI tools (sentiment and image classification)
+
+Results are keyed on the tool plus the content itself: whitespace-normalized
+text, or a hash of the decoded image's pixels, so the same picture sent
+twice (even re-encoded) is only classified once.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+def content_key(tool_name, query):
+    """Cache key for running `tool_name` on `query` (a string or a PIL image)"""
+    if hasattr(query, 'tobytes'):
+        digest = hashlib.sha256(f'{query.mode}:{query.size}:'.encode())
+        digest.update(query.tobytes())
+        return f'{tool_name}:image:{digest.hexdigest()}'
+    text = ' '.join(unicodedata.normalize('NFC', str(query)).split())
+    return f'{tool_name}:text:{hashlib.sha256(text.encode()).hexdigest()}'
+
+
+class ResultCache:
+    """Thread-safe LRU cache of tool results, optionally kept in SQLite across restarts
+
+    With a `path`, every new result is also written to that SQLite file and
+    the most recently stored `maxsize` results are loaded back at startup.
+    """
+
+    def __init__(self, maxsize=1024, path=None):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS results '
+                             '(key TEXT PRIMARY KEY, value TEXT, stored_at REAL)')
+            rows = self._db.execute('SELECT key, value FROM results ORDER BY stored_at DESC LIMIT ?',
+                                    (maxsize,)).fetchall()
+            for key, value in reversed(rows):
+                self._data[key] = value
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            evicted = []
+            while len(self._data) > self.maxsize:
+                evicted.append(self._data.popitem(last=False)[0])
+            if self._db is not None:
+                with self._db:
+                    self._db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?)',
+                                     (key, value, time.time()))
+                    self._db.executemany('DELETE FROM results WHERE key = ?',
+                                         [(k,) for k in evicted])
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'size': len(self._data), 'maxsize': self.maxsize,
+                    'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                    'persistent': self._db is not None}
@@ -0,0 +1,152 @@
+"""
+Compare the CPU backends (torch, int8, onnx) for each tool: load time,
+latency and how closely each backend agrees with full-precision torch
+
+Usage:
+    python compare_backends.py
+    python compare_backends.py --tools semantics classifier --backends torch int8 onnx --repeats 20
+    python compare_backends.py --json results.json
+
+Accuracy is measured against the torch backend on the same inputs:
+    semantics   top-1 emotion agreement and the largest score difference
+    classifier  top-1 label agreement and the largest score difference
+    generative  greedy decoding, so the fraction of answers identical to torch
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+import images
+import models
+import tools
+
+TEXTS = [
+    "I can't believe we finally won the championship!",
+    "This is the worst customer service I have ever experienced.",
+    "I'm not sure how I feel about moving to a new city.",
+    "Thank you so much for helping me with my homework.",
+    "The movie was okay, nothing special.",
+    "I'm scared of what the test results will say.",
+    "Wow, I did not see that plot twist coming!",
+    "Why does this keep happening to me?",
+]
+
+IMAGES = ['banana.jpg', 'image.jpg']
+
+PROMPTS = [
+    "the ocean at night",
+    "a haunted library",
+    "why is the sky blue?",
+]
+
+TOOLS = {
+    'semantics': tools.SemanticsAnalyzer,
+    'classifier': tools.ImageClassifier,
+    'haiku': tools.HaikuWriter,
+    'quest': tools.RPGQuestGenerator,
+    'explainer': tools.WhyExplainer,
+}
+
+
+def load_inputs(tool_name):
+    if tool_name == 'semantics':
+        return TEXTS
+    if tool_name == 'classifier':
+        # Decoded like uploads are, so the inputs match what the app serves
+        decoded = []
+        for path in IMAGES:
+            with open(path, 'rb') as f:
+                decoded.append(images.decode(f.read()))
+        return decoded
+    return PROMPTS
+
+
+def raw_outputs(tool, tool_name, inputs):
+    """Each input's labels and scores, as the app computes them, or its generated text"""
+    if tool_name == 'semantics':
+        return [tool.model(text)[0] for text in inputs]
+    if tool_name == 'classifier':
+        # The app classifies through process_batch, not the pipeline's own preprocessing
+        return tool.predict(inputs)
+    # Greedy decoding, so backends can be compared on the same output
+    return [tool.generator(tool.messages(prompt), do_sample=False)[0]['generated_text'][-1]['content']
+            for prompt in inputs]
+
+
+def agreement(tool_name, outputs, reference):
+    """(fraction of inputs matching the reference, largest score difference)"""
+    if tool_name in ('semantics', 'classifier'):
+        same = [out[0]['label'] == ref[0]['label'] for out, ref in zip(outputs, reference)]
+        diffs = []
+        for out, ref in zip(outputs, reference):
+            scores = {r['label']: r['score'] for r in out}
+            diffs.extend(abs(scores.get(r['label'], 0.0) - r['score']) for r in ref[:5])
+        return float(np.mean(same)), float(max(diffs))
+    same = [out == ref for out, ref in zip(outputs, reference)]
+    return float(np.mean(same)), None
+
+
+def run_backend(tool_name, backend, inputs, repeats):
+    tool = TOOLS[tool_name](backend)
+    start = time.perf_counter()
+    tool.init_model()
+    load_seconds = time.perf_counter() - start
+    try:
+        outputs = raw_outputs(tool, tool_name, inputs)  # also warms up
+        times = []
+        for _ in range(repeats):
+            for item in inputs:
+                start = time.perf_counter()
+                tool.process_query(item)
+                times.append((time.perf_counter() - start) * 1000)
+    finally:
+        tool.unload_model()
+    return {'load_s': round(load_seconds, 2),
+            'median_ms': round(float(np.median(times)), 1),
+            'p90_ms': round(float(np.percentile(times, 90)), 1)}, outputs
+
+
+def compare(tool_names, backends, repeats):
+    rows = []
+    for tool_name in tool_names:
+        inputs = load_inputs(tool_name)
+        reference = None
+        baseline_ms = None
+        # torch always runs first as the reference
+        for backend in ['torch'] + [b for b in backends if b != 'torch']:
+            try:
+                timing, outputs = run_backend(tool_name, backend, inputs, repeats)
+            except Exception as e:
+                rows.append({'tool': tool_name, 'backend': backend, 'error': str(e)})
+                print(f"{tool_name:<11} {backend:<6} failed: {e}")
+                continue
+            if reference is None:
+                reference, baseline_ms = outputs, timing['median_ms']
+            match, max_diff = agreement(tool_name, outputs, reference)
+            row = {'tool': tool_name, 'backend': backend, **timing,
+                   'speedup': round(baseline_ms / timing['median_ms'], 2) if timing['median_ms'] else None,
+                   'agreement': match, 'max_score_diff': max_diff}
+            if backend in backends:
+                rows.append(row)
+                diff = f"{max_diff:.4f}" if max_diff is not None else '-'
+                speedup = f"{row['speedup']:5.2f}x" if row['speedup'] else '    -'
+                print(f"{tool_name:<11} {backend:<6} load {timing['load_s']:6.1f} s  "
+                      f"median {timing['median_ms']:8.1f} ms  p90 {timing['p90_ms']:8.1f} ms  "
+                      f"speedup {speedup}  agreement {match:6.1%}  max diff {diff}")
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare CPU inference backends for the AI tools')
+    parser.add_argument('--tools', nargs='+', choices=list(TOOLS), default=list(TOOLS))
+    parser.add_argument('--backends', nargs='+', choices=models.BACKENDS, default=list(models.BACKENDS))
+    parser.add_argument('--repeats', type=int, default=5, help='passes over the inputs per backend')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    rows = compare(args.tools, args.backends, args.repeats)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
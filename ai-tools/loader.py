@@ -0,0 +1,115 @@
+"""
+Lazy loading for the AI tools
+
+Tools load their model the first time they are used instead of at import,
+can be warmed up in a background thread so the server answers right away,
+and are unloaded again after sitting idle.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+
+class _State:
+    def __init__(self):
+        self.lock = threading.Lock()  # held while loading or unloading
+        self.loaded = False
+        self.active = 0  # requests using the tool right now
+        self.last_used = None
+        self.error = None
+
+
+class ToolManager:
+    """Owns the tool instances and decides when their models are loaded
+
+    Use a tool through `with manager.use(name) as tool:`; it is loaded on
+    first use. Tools unused for `idle_timeout` seconds are unloaded by
+    start_reaper().
+    """
+
+    def __init__(self, tools, idle_timeout=None):
+        self.tools = tools
+        self.idle_timeout = idle_timeout
+        self._states = {name: _State() for name in tools}
+        self._lock = threading.Lock()
+
+    def load(self, name):
+        state = self._states[name]
+        with state.lock:
+            if not state.loaded:
+                print(f"  Loading {name}...")
+                try:
+                    with metrics.timer('load_model', tool=name):
+                        self.tools[name].init_model()
+                except Exception as e:
+                    state.error = str(e)
+                    raise
+                state.loaded = True
+                state.error = None
+                state.last_used = time.monotonic()
+        return self.tools[name]
+
+    def unload(self, name):
+        state = self._states[name]
+        with state.lock:
+            if state.loaded and not state.active:
+                print(f"  Unloading idle {name}...")
+                self.tools[name].unload_model()
+                state.loaded = False
+
+    @contextmanager
+    def use(self, name):
+        """The tool `name`, loaded and kept loaded while the block runs"""
+        state = self._states[name]
+        with self._lock:
+            state.active += 1
+        try:
+            yield self.load(name)
+        finally:
+            with self._lock:
+                state.active -= 1
+                state.last_used = time.monotonic()
+
+    def status(self):
+        """{name: {'loaded', 'error', 'idle_seconds'}} for every tool"""
+        now = time.monotonic()
+        return {name: {'loaded': state.loaded,
+                       'error': state.error,
+                       'idle_seconds': None if state.last_used is None or state.active
+                       else round(now - state.last_used, 1)}
+                for name, state in self._states.items()}
+
+    def warmup(self, names=None):
+        """Load the tools in a background thread, returning the thread"""
+        def run():
+            for name in names or self.tools:
+                try:
+                    self.load(name)
+                except Exception as e:
+                    print(f"  Could not load {name}: {e}")
+
+        thread = threading.Thread(target=run, name='warmup', daemon=True)
+        thread.start()
+        return thread
+
+    def unload_idle(self):
+        if not self.idle_timeout:
+            return
+        now = time.monotonic()
+        for name, state in self._states.items():
+            if (state.loaded and not state.active and state.last_used is not None and
+                    now - state.last_used > self.idle_timeout):
+                self.unload(name)
+
+    def start_reaper(self, interval=60):
+        """Check for idle tools every `interval` seconds in a background thread"""
+        def run():
+            while True:
+                time.sleep(interval)
+                self.unload_idle()
+
+        thread = threading.Thread(target=run, name='idle-unloader', daemon=True)
+        thread.start()
+        return thread
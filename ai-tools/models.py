@@ -0,0 +1,159 @@
+"""
+Shared model registry for the AI tools
+
+Several tools use the same model (the haiku, quest and explainer tools all
+run SmolLM2). acquire() loads each distinct pipeline once and hands out
+handles to it; each handle carries its own tool's default call arguments,
+such as generation settings. The pipeline is dropped when the last handle
+is released.
+
+Each pipeline can run on one of several CPU backends:
+    torch  full-precision PyTorch (the default)
+    int8   PyTorch with the Linear layers dynamically quantized to int8
+    onnx   exported to ONNX and run by onnxruntime (needs `pip install optimum[onnxruntime]`)
+"""
+import threading
+
+import transformers
+
+BACKENDS = ('torch', 'int8', 'onnx')
+
+_lock = threading.Lock()
+_entries = {}  # key -> _Entry
+
+
+class _Entry:
+    def __init__(self, key):
+        self.key = key
+        self.pipeline = None
+        self.refs = 0
+        self.lock = threading.Lock()  # held while loading, so a model only loads once
+
+
+class ModelHandle:
+    """One tool's reference to a shared pipeline
+
+    Calling the handle calls the pipeline, with the tool's `defaults`
+    filled in for any keyword arguments not given.
+    """
+
+    def __init__(self, entry, defaults):
+        self._entry = entry
+        self.defaults = defaults
+
+    @property
+    def pipeline(self):
+        return self._entry.pipeline
+
+    def __call__(self, inputs, **kwargs):
+        return self._entry.pipeline(inputs, **{**self.defaults, **kwargs})
+
+    def stream(self, inputs, **kwargs):
+        """Yield generated text piece by piece as the model produces it
+
+        Generation runs in a background thread. If the consumer stops early
+        (e.g. the client disconnects) generation is stopped at the next token.
+        """
+        streamer = transformers.TextIteratorStreamer(self._entry.pipeline.tokenizer,
+                                                     skip_prompt=True, skip_special_tokens=True)
+        stop = threading.Event()
+        errors = []
+
+        def run():
+            try:
+                self(inputs, streamer=streamer,
+                     stopping_criteria=transformers.StoppingCriteriaList([_StopOn(stop)]), **kwargs)
+            except Exception as e:
+                errors.append(e)
+                streamer.end()
+
+        thread = threading.Thread(target=run, name='generate', daemon=True)
+        thread.start()
+        try:
+            for text in streamer:
+                if text:
+                    yield text
+        finally:
+            stop.set()
+        thread.join()
+        if errors:
+            raise errors[0]
+
+    def release(self):
+        release(self)
+
+
+class _StopOn(transformers.StoppingCriteria):
+    """Stops generation once `event` is set"""
+
+    def __init__(self, event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return self.event.is_set()
+
+
+def _key(task, model, backend, kwargs):
+    return task, model, backend, tuple(sorted((k, repr(v)) for k, v in kwargs.items()))
+
+
+def _load(task, model, backend, pipeline_kwargs):
+    if backend == 'torch':
+        return transformers.pipeline(task, model=model, **pipeline_kwargs)
+    if backend == 'int8':
+        import torch
+
+        pipe = transformers.pipeline(task, model=model, **pipeline_kwargs)
+        # Weights are stored as int8; activations are quantized on the fly
+        pipe.model = torch.quantization.quantize_dynamic(pipe.model, {torch.nn.Linear},
+                                                         dtype=torch.qint8)
+        return pipe
+    if backend == 'onnx':
+        try:
+            from optimum.pipelines import pipeline as ort_pipeline
+        except ImportError:
+            raise ValueError("The onnx backend needs the optimum package: "
+                             "pip install optimum[onnxruntime]")
+        # Exports the model to ONNX the first time (cached by optimum afterwards)
+        return ort_pipeline(task, model=model, accelerator='ort', **pipeline_kwargs)
+    raise ValueError(f"Unknown backend {backend!r}; choose from {', '.join(BACKENDS)}")
+
+
+def acquire(task, model, defaults=None, backend='torch', **pipeline_kwargs):
+    """Handle to transformers.pipeline(task, model=model, **pipeline_kwargs), loading it if needed
+
+    `defaults` are keyword arguments added to every call made through this
+    handle; `backend` is one of BACKENDS.
+    """
+    key = _key(task, model, backend, pipeline_kwargs)
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            entry = _entries[key] = _Entry(key)
+        entry.refs += 1
+    try:
+        with entry.lock:
+            if entry.pipeline is None:
+                entry.pipeline = _load(task, model, backend, pipeline_kwargs)
+    except Exception:
+        release(ModelHandle(entry, None))
+        raise
+    return ModelHandle(entry, dict(defaults or {}))
+
+
+def release(handle):
+    """Give back a handle; the pipeline is freed once no handles are left"""
+    entry = handle._entry
+    with _lock:
+        entry.refs -= 1
+        if entry.refs <= 0 and _entries.get(entry.key) is entry:
+            del _entries[entry.key]
+            entry.pipeline = None
+
+
+def loaded():
+    """{(task, model, backend): number of handles} for every loaded pipeline"""
+    with _lock:
+        return {(task, model, backend): entry.refs
+                for (task, model, backend, _), entry in _entries.items()
+                if entry.pipeline is not None}
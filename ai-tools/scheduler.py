@@ -0,0 +1,113 @@
+"""
+Micro-batching for the AI tools
+
+Requests that arrive at about the same time for the same tool are queued
+and run through the model together, as one batched pipeline call, instead
+of one forward pass each.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import metrics
+from workers import Busy
+
+
+class MicroBatcher:
+    """Queues single inputs for one tool and runs them in batches
+
+    A background thread takes the first waiting input, then keeps collecting
+    until it has `max_batch_size` inputs or `max_wait` seconds have passed,
+    and hands the whole list to `process_batch`, which must return one
+    result per input, in order. Each caller gets its own result back through
+    a Future. If a batch fails, its inputs are retried one by one so only
+    the bad input's caller sees the exception.
+
+    `threads` batches can run at once, each on its own thread. Once
+    `max_waiting` inputs are queued (0 for no limit), submit raises Busy.
+    """
+
+    def __init__(self, name, process_batch, max_batch_size=16, max_wait=0.01, threads=1, max_waiting=0):
+        self.name = name
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue(max_waiting)
+        self._threads = [threading.Thread(target=self._run, name=f'batcher-{name}-{i}', daemon=True)
+                         for i in range(threads)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, item):
+        """Queue one input, returning a Future for its result"""
+        future = Future()
+        try:
+            self._queue.put_nowait((item, future))
+        except queue.Full:
+            raise Busy(f'Too many {self.name} requests waiting; try again shortly')
+        return future
+
+    def __call__(self, item, timeout=None):
+        """Process one input, waiting up to `timeout` seconds for the batch it ends up in"""
+        future = self.submit(item)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            future.cancel()  # skipped if its batch hasn't started yet
+            raise TimeoutError(f'{self.name} did not answer within {timeout} seconds')
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Callers that gave up (cancelled futures) don't need a result
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                self._process(batch)
+            except Exception:
+                if len(batch) == 1:
+                    continue
+                # Run the inputs one at a time so one bad input only fails its own request
+                for entry in batch:
+                    try:
+                        self._process([entry])
+                    except Exception:
+                        pass
+            # No caller may be left waiting on a future nothing will resolve
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError(f'{self.name} produced no result for this input'))
+
+    def _process(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            with metrics.timer('batch_inference', tool=self.name):
+                results = self.process_batch(items)
+            if len(results) != len(items):
+                raise RuntimeError(f'{self.name} returned {len(results)} results for {len(items)} inputs')
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+            raise
+        metrics.inc('batches_total', tool=self.name)
+        metrics.inc('batched_inputs_total', len(items), tool=self.name)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
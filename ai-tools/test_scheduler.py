@@ -0,0 +1,42 @@
+"""
+Tests for the micro-batcher's concurrency and queue limit
+
+Run with: python -m pytest -q test_scheduler.py
+"""
+import threading
+
+import pytest
+
+import workers
+from scheduler import MicroBatcher
+
+
+def test_batches_run_in_parallel():
+    both_running = threading.Barrier(2, timeout=5)
+
+    def process_batch(items):
+        both_running.wait()  # only returns once two batches are in flight
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher('double', process_batch, max_batch_size=1, threads=2)
+    futures = [batcher.submit(i) for i in range(2)]
+    assert [future.result(5) for future in futures] == [0, 2]
+
+
+def test_full_queue_is_busy():
+    release = threading.Event()
+    started = threading.Event()
+
+    def process_batch(items):
+        started.set()
+        release.wait(5)
+        return items
+
+    batcher = MicroBatcher('slow', process_batch, max_batch_size=1, max_waiting=2)
+    first = batcher.submit('running')
+    assert started.wait(5)
+    waiting = [batcher.submit('a'), batcher.submit('b')]
+    with pytest.raises(workers.Busy):
+        batcher.submit('c')
+    release.set()
+    assert [f.result(5) for f in [first] + waiting] == ['running', 'a', 'b']
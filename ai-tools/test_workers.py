@@ -0,0 +1,77 @@
+"""
+Tests for the worker pools, using a stand-in tool so no models are loaded
+
+Run with: python -m pytest -q test_workers.py
+"""
+import os
+import signal
+import time
+
+import pytest
+
+pytest.importorskip('torch')  # the workers set their torch thread count
+
+import workers
+
+
+class Echo:
+    """Tool whose methods echo, crash the worker, or take their time"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def init_model(self):
+        pass
+
+    def process_query(self, text):
+        return f'echo {text}'
+
+    def crash(self, code):
+        os._exit(code)
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+        return 'slept'
+
+
+@pytest.fixture
+def pool():
+    pool = workers.WorkerPool('test', {'echo': ('Echo', 'torch')}, timeout=20, module='test_workers')
+    wait_until(lambda: 'echo' in pool.loaded)
+    yield pool
+    pool.close()
+
+
+def wait_until(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.05)
+
+
+def test_call(pool):
+    assert pool.call('echo', 'process_query', 'hi') == 'echo hi'
+
+
+def test_call_after_worker_killed(pool):
+    assert pool.call('echo', 'process_query', 'before') == 'echo before'
+    process = pool._workers[0].process
+    os.kill(process.pid, signal.SIGKILL)
+    process.join()
+    assert pool.call('echo', 'process_query', 'after') == 'echo after'
+    assert pool._workers[0].process is not process
+
+
+def test_job_fails_when_its_worker_dies(pool):
+    with pytest.raises(workers.WorkerError, match='died'):
+        pool.call('echo', 'crash', 1)
+    assert pool.call('echo', 'process_query', 'again') == 'echo again'
+
+
+def test_timeout_and_late_result(pool):
+    pool.timeout = 0.2
+    with pytest.raises(workers.WorkerError, match='did not answer'):
+        pool.call('echo', 'sleep', 1)
+    pool.timeout = 20
+    # The late 'slept' result is dropped without breaking the result reader
+    assert pool.call('echo', 'process_query', 'later') == 'echo later'
@@ -1,19 +1,30 @@
-import transformers
 import torch 
 
+import models
+from images import pixel_values
+
+# Chat model shared by the haiku, quest and explainer tools
+SMOLLM2 = 'HuggingFaceTB/SmolLM2-135M-Instruct'
+
 class SemanticsAnalyzer:
     """Analyzes the semantic meaning and emotions of text"""
     
-    def __init__(self):
+    def __init__(self, backend='torch'):
+        self.backend = backend  # see models.BACKENDS
         self.model = None
     
     def init_model(self):
         print("Loading sentiment analysis model...")
-        self.model = transformers.pipeline('sentiment-analysis', model='SamLowe/roberta-base-go_emotions', top_k=None)
+        self.model = models.acquire('sentiment-analysis', 'SamLowe/roberta-base-go_emotions',
+                                    backend=self.backend, top_k=None)
         print("✓ Sentiment model ready!")
     
-    def process_query(self, text):
-        output = self.model(text)[0]
+    def unload_model(self):
+        if self.model is not None:
+            self.model.release()
+            self.model = None
+    
+    def format_output(self, output):
         top_k = 5 
         
         results = ""
@@ -22,22 +33,34 @@ class SemanticsAnalyzer:
             results += f"{output[k]['label']}, confidence: {round(output[k]['score'], 4)}\n"
             
         return results
+    
+    def process_query(self, text):
+        return self.format_output(self.model(text)[0])
+    
+    def process_batch(self, texts):
+        """Score several texts in one batched forward pass"""
+        outputs = self.model(list(texts), batch_size=len(texts))
+        return [self.format_output(output) for output in outputs]
         
 class ImageClassifier:
     """Classifies what objects appear in an image"""
     
-    def __init__(self):
+    def __init__(self, backend='torch'):
+        self.backend = backend  # see models.BACKENDS
         self.model = None
     
     def init_model(self):
         print("Loading image classification model...")
-        self.model = transformers.pipeline('image-classification', 
-                            model='google/vit-base-patch16-224')
+        self.model = models.acquire('image-classification', 'google/vit-base-patch16-224',
+                                    backend=self.backend)
         print("✓ Image classifier ready!")
     
-    def process_query(self, image):
-        results = self.model(image)
-        
+    def unload_model(self):
+        if self.model is not None:
+            self.model.release()
+            self.model = None
+    
+    def format_output(self, results):
         label = results[0]['label']
         confidence = round(results[0]['score'] * 100, 3)
         secondary_label = results[1]['label']
@@ -46,19 +69,49 @@ class ImageClassifier:
         results = f"I am {confidence}% sure it is {label}, but it might also be {secondary_label}, which I am {secondary_confidence}% sure about"
         
         return results
+    
+    def process_query(self, image):
+        return self.process_batch([image])[0]
+    
+    def predict(self, images):
+        """Top 5 {'label', 'score'} for each image, from one batched forward pass
+        
+        Resizing and normalizing is done for the whole batch at once rather
+        than by the pipeline's image processor one image at a time.
+        """
+        pipe = self.model.pipeline
+        processor = pipe.image_processor
+        size = (processor.size['width'], processor.size['height'])
+        inputs = torch.from_numpy(pixel_values(images, size, processor.image_mean, processor.image_std))
+        with torch.no_grad():
+            scores = pipe.model(pixel_values=inputs).logits.softmax(-1)
+        top = scores.topk(5)
+        labels = pipe.model.config.id2label
+        return [[{'label': labels[int(i)], 'score': float(score)} for score, i in zip(values, indices)]
+                for values, indices in zip(top.values, top.indices)]
+    
+    def process_batch(self, images):
+        """Classify several images in one batched forward pass"""
+        return [self.format_output(output) for output in self.predict(images)]
         
 class TextSummarizer:
     """Summarizes long text into shorter versions"""
     
-    def __init__(self):
+    def __init__(self, backend='torch'):
+        self.backend = backend  # see models.BACKENDS
         self.model = None
     
     def init_model(self):
         print("Loading summarization model...")
-        self.model = transformers.pipeline('summarization', 
-                            model='facebook/bart-large-cnn')
+        self.model = models.acquire('summarization', 'facebook/bart-large-cnn',
+                                    backend=self.backend)
         print("✓ Summarizer ready!")
     
+    def unload_model(self):
+        if self.model is not None:
+            self.model.release()
+            self.model = None
+    
     def process_query(self, text):
         # Generate summary
         max_length = 200
@@ -85,98 +138,120 @@ class TextSummarizer:
         return results
 
 class HaikuWriter:
-    def __init__(self):
+    def __init__(self, backend='torch'):
+        self.backend = backend  # see models.BACKENDS
         self.generator = None
 
     def init_model(self):
-        self.generator = transformers.pipeline(
-            'text-generation',
-            model='HuggingFaceTB/SmolLM2-135M-Instruct',
+        # Shares the loaded model with the other SmolLM2 tools
+        self.generator = models.acquire(
+            'text-generation', SMOLLM2, backend=self.backend,
+            defaults=dict(max_new_tokens=50, do_sample=True, temperature=0.7,
+                          top_k=50, top_p=0.95),
             device=-1 # CPU
         )
 
-    def process_query(self, topic):
+    def unload_model(self):
+        if self.generator is not None:
+            self.generator.release()
+            self.generator = None
+
+    def messages(self, topic):
         # We use a chat-style template which this model understands perfectly
-        messages = [
+        return [
             {"role": "user",
              "content": f"Write a short 3-line haiku about {topic}. No extra text."}
         ]
 
+    def process_query(self, topic):
         # This model handles the prompt formatting for us
-        result = self.generator(
-            messages,
-            max_new_tokens=50,
-            do_sample=True,
-            temperature=0.7,
-            top_k=50,
-            top_p=0.95
-        )
+        result = self.generator(self.messages(topic))
 
         # Extract only the assistant's response
         haiku = result[0]['generated_text'][-1]['content']
 
         return f"Here's a haiku about {topic}:\n{haiku}"
+
+    def stream_query(self, topic):
+        """Like process_query, but yields the text as it is generated"""
+        yield f"Here's a haiku about {topic}:\n"
+        yield from self.generator.stream(self.messages(topic))
     
 class RPGQuestGenerator:
     """Generates a video game quest based on a location or theme"""
 
-    def __init__(self):
+    def __init__(self, backend='torch'):
+        self.backend = backend  # see models.BACKENDS
         self.generator = None
 
     def init_model(self):
-        self.generator = transformers.pipeline(
-            'text-generation',
-            model='HuggingFaceTB/SmolLM2-135M-Instruct',
+        # Shares the loaded model with the other SmolLM2 tools
+        self.generator = models.acquire(
+            'text-generation', SMOLLM2, backend=self.backend,
+            defaults=dict(max_new_tokens=60, do_sample=True,
+                          temperature=0.8, # Slightly higher for creativity
+                          top_k=50, top_p=0.95),
             device=-1 # CPU
         )
 
-    def process_query(self, setting):
-        messages = [
+    def unload_model(self):
+        if self.generator is not None:
+            self.generator.release()
+            self.generator = None
+
+    def messages(self, setting):
+        return [
             {"role": "user",
              "content": f"You are a Game Master. Write a short, single-sentence quest objective for a player (3rd-person grammar) in: {setting}."}
         ]
 
-        result = self.generator(
-            messages,
-            max_new_tokens=60,
-            do_sample=True,
-            temperature=0.8, # Slightly higher for creativity
-            top_k=50,
-            top_p=0.95
-        )
+    def process_query(self, setting):
+        result = self.generator(self.messages(setting))
 
         # Extract only the assistant's response
         quest = result[0]['generated_text'][-1]['content']
 
         return f"⚔️ New Quest in [{setting}]:\n{quest}"
+
+    def stream_query(self, setting):
+        """Like process_query, but yields the text as it is generated"""
+        yield f"⚔️ New Quest in [{setting}]:\n"
+        yield from self.generator.stream(self.messages(setting))
     
 class WhyExplainer:
     """Explains 'why' something works the way it does"""
 
-    def __init__(self):
+    def __init__(self, backend='torch'):
+        self.backend = backend  # see models.BACKENDS
         self.generator = None
 
     def init_model(self):
-        self.generator = transformers.pipeline(
-            'text-generation',
-            model='HuggingFaceTB/SmolLM2-135M-Instruct',
+        # Shares the loaded model with the other SmolLM2 tools
+        self.generator = models.acquire(
+            'text-generation', SMOLLM2, backend=self.backend,
+            defaults=dict(max_new_tokens=200, # Increased for explanations
+                          do_sample=True, temperature=0.7, top_k=50, top_p=0.95),
             device=-1 # CPU
         )
 
-    def process_query(self, question):
-        messages = [
+    def unload_model(self):
+        if self.generator is not None:
+            self.generator.release()
+            self.generator = None
+
+    def messages(self, question):
+        return [
             {"role": "user",
              "content": f"Explain clearly and concisely: {question}"}
         ]
 
-        result = self.generator(
-            messages,
-            max_new_tokens=200, # Increased for explanations
-            do_sample=True,
-            temperature=0.7,
-            top_k=50,
-            top_p=0.95
-        )
+    def process_query(self, question):
+        result = self.generator(self.messages(question))
 
         answer = result[0]['generated_text'][-1]['content']
-        return f"Here is an answer to your question: \n{answer}"
\ No newline at end of file
+        return f"Here is an answer to your question: \n{answer}"
+
+    def stream_query(self, question):
+        """Like process_query, but yields the text as it is generated"""
+        yield "Here is an answer to your question: \n"
+        yield from self.generator.stream(self.messages(question))
\ No newline at end of file
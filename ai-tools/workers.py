@@ -0,0 +1,264 @@
+"""
+Worker processes for the AI tools
+
+Each pool runs a group of tools (e.g. the three SmolLM2 tools, which share
+one model) in its own processes, with its own torch thread budget. Requests
+reach the workers over a queue, so a long generation in one pool can't hold
+up the classifiers in another, and the Flask process never runs a model.
+
+Each tool also has a concurrency limit: at most that many of its requests
+are handed to the workers at once, the rest wait in the web process. Once
+`max_waiting` requests are waiting, new ones are turned away with Busy.
+
+Every worker has its own job queue and result pipe. When a worker dies its
+jobs fail with WorkerError and a fresh worker, with fresh queues, replaces
+it; a process killed while reading a shared queue would keep its lock.
+"""
+import atexit
+import importlib
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+
+
+class Busy(Exception):
+    """Too many requests are already waiting for this tool"""
+
+
+class WorkerError(Exception):
+    """A tool raised an exception inside a worker process"""
+
+
+def _worker_main(module, specs, threads, jobs, results):
+    """Body of one worker process: load the group's tools, then serve jobs until None"""
+    import torch
+
+    torch.set_num_threads(threads)
+    tools = importlib.import_module(module)
+    instances = {}
+    for name, (class_name, backend) in specs.items():
+        instances[name] = getattr(tools, class_name)(backend)
+        try:
+            instances[name].init_model()
+            results.send(('loaded', name, None))
+        except Exception as e:
+            results.send(('load_error', name, str(e)))
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        job_id, name, method, arg = job
+        try:
+            if method == 'stream_query':
+                for text in instances[name].stream_query(arg):
+                    results.send(('chunk', job_id, text))
+                results.send(('done', job_id, None))
+            else:
+                results.send(('result', job_id, getattr(instances[name], method)(arg)))
+        except Exception as e:
+            results.send(('error', job_id, str(e)))
+
+
+class _Worker:
+    def __init__(self, process, jobs, results, writer):
+        self.process = process
+        self.jobs = jobs
+        self.results = results  # receiving end of the worker's result pipe
+        self.writer = writer  # sending end, closed here once the process has it
+        self.job_ids = set()  # jobs sent to this worker and not finished yet
+
+
+class WorkerPool:
+    """Processes running one group of tools
+
+    `specs` maps tool names to (class name in `module`, backend); `limits`
+    maps tool names to how many of their requests may run at once. Calls
+    give up with WorkerError after `timeout` seconds (None waits forever).
+    """
+
+    def __init__(self, name, specs, processes=1, threads=1, limits=None, max_waiting=64,
+                 timeout=None, module='tools'):
+        self.name = name
+        self.specs = specs
+        self.threads = threads
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.module = module
+        # spawn, not fork: torch and its thread pools don't survive a fork
+        self._ctx = multiprocessing.get_context('spawn')
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._replaced = threading.Condition(self._lock)
+        self._pending = {}  # job id -> Future, or queue.Queue for streams
+        self._job_workers = {}  # job id -> the _Worker running it
+        self._closed = False
+        limits = limits or {}
+        self._slots = {tool: threading.BoundedSemaphore(limits.get(tool, processes)) for tool in specs}
+        self.waiting = {tool: 0 for tool in specs}
+        self.running = {tool: 0 for tool in specs}
+        self.loaded = set()
+        self.errors = {}
+        self._workers = [None] * processes
+        for index in range(processes):
+            self._start(self._new_worker(index), index)
+        # Otherwise the workers being stopped at exit look like crashes to restart
+        atexit.register(self.close)
+
+    def _new_worker(self, index):
+        results, writer = self._ctx.Pipe(duplex=False)
+        jobs = self._ctx.Queue()
+        process = self._ctx.Process(target=_worker_main, name=f'{self.name}-{index}', daemon=True,
+                                    args=(self.module, self.specs, self.threads, jobs, writer))
+        worker = _Worker(process, jobs, results, writer)
+        self._workers[index] = worker
+        return worker
+
+    def _start(self, worker, index):
+        worker.process.start()
+        # Only the worker holds the sending end now, so the pipe closes when it dies
+        worker.writer.close()
+        threading.Thread(target=self._read_results, args=(worker, index),
+                         name=f'{worker.process.name}-results', daemon=True).start()
+
+    def _forget(self, job_id):
+        worker = self._job_workers.pop(job_id, None)
+        if worker is not None:
+            worker.job_ids.discard(job_id)
+        return self._pending.pop(job_id, None)
+
+    def _fail(self, job_id, message):
+        target = self._forget(job_id)
+        if isinstance(target, Future):
+            target.set_exception(WorkerError(message))
+        elif target is not None:
+            target.put(('error', message))
+
+    def _read_results(self, worker, index):
+        while True:
+            try:
+                kind, key, value = worker.results.recv()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                # A job may already have been given up on (timeout), so its
+                # messages are dropped
+                if kind == 'loaded':
+                    self.loaded.add(key)
+                    self.errors.pop(key, None)
+                elif kind == 'load_error':
+                    self.errors[key] = value
+                elif kind == 'chunk':
+                    target = self._pending.get(key)
+                    if target is not None:
+                        target.put(('chunk', value))
+                elif kind == 'done':
+                    target = self._forget(key)
+                    if target is not None:
+                        target.put(('done', None))
+                elif kind == 'result':
+                    target = self._forget(key)
+                    if target is not None:
+                        target.set_result(value)
+                elif kind == 'error':
+                    self._fail(key, value)
+
+        # The pipe only closes once the worker has exited
+        worker.process.join()
+        worker.jobs.cancel_join_thread()
+        worker.jobs.close()
+        if self._closed:
+            return
+        with self._lock:
+            for job_id in list(worker.job_ids):
+                self._fail(job_id, f'{self.name} worker process died')
+            # New jobs go to the replacement's queue from here on
+            replacement = self._new_worker(index)
+            self._replaced.notify_all()
+        print(f"  Restarting {worker.process.name} (exit code {worker.process.exitcode})")
+        time.sleep(1)  # don't spin if it keeps crashing while loading
+        if not self._closed:
+            self._start(replacement, index)
+
+    @contextmanager
+    def _slot(self, tool):
+        """Wait for one of the tool's concurrency slots"""
+        with self._lock:
+            if self.waiting[tool] >= self.max_waiting:
+                raise Busy(f'Too many {tool} requests waiting; try again shortly')
+            self.waiting[tool] += 1
+        self._slots[tool].acquire()
+        with self._lock:
+            self.waiting[tool] -= 1
+            self.running[tool] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.running[tool] -= 1
+            self._slots[tool].release()
+
+    def _submit(self, tool, method, arg, target):
+        with self._lock:
+            # Skip workers that have exited but whose results thread hasn't
+            # replaced them yet; their jobs would only fail
+            live = [w for w in self._workers if w.process.exitcode is None]
+            while not live:
+                self._replaced.wait()
+                live = [w for w in self._workers if w.process.exitcode is None]
+            job_id = next(self._ids)
+            worker = min(live, key=lambda w: len(w.job_ids))
+            worker.job_ids.add(job_id)
+            self._job_workers[job_id] = worker
+            self._pending[job_id] = target
+        worker.jobs.put((job_id, tool, method, arg))
+        return job_id
+
+    def _give_up(self, job_id, tool):
+        with self._lock:
+            self._forget(job_id)
+        return WorkerError(f'{tool} did not answer within {self.timeout} seconds')
+
+    def call(self, tool, method, arg):
+        """Run <class>.<method>(arg) in a worker and return the result"""
+        with self._slot(tool):
+            future = Future()
+            job_id = self._submit(tool, method, arg, future)
+            try:
+                return future.result(self.timeout)
+            except FutureTimeout:
+                raise self._give_up(job_id, tool)
+
+    def stream(self, tool, arg):
+        """Yield the pieces of text the tool's stream_query(arg) produces in a worker
+
+        The job runs to the end even if the caller stops reading. `timeout`
+        applies to the wait for each piece.
+        """
+        with self._slot(tool):
+            chunks = queue.Queue()
+            job_id = self._submit(tool, 'stream_query', arg, chunks)
+            while True:
+                try:
+                    kind, value = chunks.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise self._give_up(job_id, tool)
+                if kind == 'done':
+                    return
+                if kind == 'error':
+                    raise WorkerError(value)
+                yield value
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        for worker in self._workers:
+            worker.jobs.put(None)
+        for worker in self._workers:
+            if worker.process.pid is not None:
+                worker.process.join(timeout=5)
@@ -0,0 +1,83 @@
+"""
+Core analysis for the FFT analyzer, shared by the web app and the batch tool
+"""
+import spectrum
+import plots
+import decoders
+import metrics
+
+
+def analyze_audio(file_path, streaming=False, block_size=8192, render_plots=True,
+                  num_components=30, fast_len=True, peaks=True, resample_to=None):
+    """Perform FFT on audio file and extract top sine wave components
+
+    Each component has a frequency, magnitude, phase and equation, plus a
+    base64 PNG plot when `render_plots` is set.
+
+    In streaming mode the file is read in blocks of `block_size` samples and
+    a Welch-averaged spectrum is built, so memory use doesn't grow with the
+    length of the recording.
+
+    With `peaks` the signal is Hann-windowed and each component is a distinct
+    spectral peak, with its frequency and magnitude interpolated between bins
+    and magnitudes in sine amplitude units. Without it the raw top bins are
+    reported.
+
+    WAV files are read directly; other formats (FLAC, OGG, MP3, ...) go
+    through the decoders module. `resample_to` converts the audio to that
+    sample rate while it is decoded.
+    """
+    
+    if streaming:
+        # Decoding and the FFTs are interleaved, so they are timed together
+        with metrics.timer('decode_welch'):
+            sample_rate, blocks = decoders.decode_blocks(file_path, block_size, resample_to)
+            acc = spectrum.WelchAccumulator(sample_rate, nperseg=block_size)
+            for block in blocks:
+                acc.feed(block)
+            xf, magnitudes, phases = acc.finish()
+            segments, offsets = acc.segments(), acc.offsets()
+    else:
+        # Read the audio file as mono float32 and take its (real) FFT
+        with metrics.timer('decode'):
+            sample_rate, data = decoders.decode(file_path, resample_to)
+        with metrics.timer('fft'):
+            xf, magnitudes, phases = spectrum.real_spectrum(data, sample_rate, fast_len,
+                                                            window='hann' if peaks else None)
+        segments = (len(data) / 2 / sample_rate, 0.0, 1)  # one Hann window over the whole file
+        offsets = None
+    
+    with metrics.timer('peak_pick'):
+        if peaks:
+            frequencies, top_magnitudes, top_phases = spectrum.pick_peaks(xf, magnitudes, phases,
+                                                                          num_components, segments, offsets)
+        else:
+            # Find the strongest frequencies by magnitude
+            top_indices = spectrum.top_k_indices(magnitudes, num_components)
+            frequencies, top_magnitudes, top_phases = xf[top_indices], magnitudes[top_indices], phases[top_indices]
+    
+    frequencies = frequencies.astype(float)
+    top_magnitudes = top_magnitudes.astype(float)
+    top_phases = top_phases.astype(float)
+    
+    results = []
+    for frequency, magnitude, phase in zip(frequencies.tolist(), top_magnitudes.tolist(),
+                                           top_phases.tolist()):
+        # Create equation string
+        equation = f"y(t) = {magnitude:.2f} * sin(2π * {frequency:.2f} * t + {phase:.2f})"
+        
+        results.append({
+            'frequency': frequency,
+            'magnitude': magnitude,
+            'phase': phase,
+            'equation': equation
+        })
+    
+    if render_plots:
+        # Render all the sine wave plots in one go, reusing a single figure
+        with metrics.timer('plot'), plots.renderer() as renderer:
+            plot_images = renderer.render_all(frequencies, top_magnitudes, top_phases)
+        for result, img_base64 in zip(results, plot_images):
+            result['plot'] = img_base64
+    
+    return results, sample_rate
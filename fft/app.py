@@ -1,206 +1,435 @@
-from flask import Flask, render_template, request, jsonify, send_file
-import numpy as np
+from flask import Flask, Request, current_app, render_template, request, jsonify, make_response, session, Response, send_file
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-from scipy.io import wavfile
-from scipy.fft import fft, fftfreq
 import base64
 from io import BytesIO
 import os
+import hashlib
+import json
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+import uuid
 from datetime import datetime
+import spectrum
+import plots
+import synth
+from analysis import analyze_audio
+import batch
+import decoders
+from cache import LRUCache
+from store import make_store
+import metrics
+
+class FFTRequest(Request):
+    """Request whose size limit is MAX_BATCH_UPLOAD for /analyze-batch and MAX_CONTENT_LENGTH elsewhere"""
+    
+    @property
+    def max_content_length(self):
+        if self.endpoint == 'analyze_batch':
+            return current_app.config['MAX_BATCH_UPLOAD']
+        return current_app.config['MAX_CONTENT_LENGTH']
 
 app = Flask(__name__)
+app.request_class = FFTRequest
+# Set FFT_SECRET_KEY when running several workers so they share sessions
+app.config['SECRET_KEY'] = os.environ.get('FFT_SECRET_KEY') or os.urandom(24)
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['NUM_COMPONENTS'] = 30  # sine waves reported per analysis
+app.config['MAX_COMPONENTS'] = 100  # upper limit for the num_components form field
+app.config['FFT_FAST_LEN'] = True  # zero-pad to a fast FFT length
+app.config['PEAK_PICKING'] = True  # report distinct interpolated peaks instead of raw bins
+app.config['STREAM_BLOCK_SIZE'] = 8192  # samples per block in streaming mode
+app.config['STREAM_THRESHOLD'] = 4 * 1024 * 1024  # files bigger than this are streamed
+app.config['RESULT_STORE'] = os.environ.get('FFT_RESULT_STORE', 'memory')  # or sqlite:///results.db
+app.config['SPECTROGRAM_MAX_FRAMES'] = 4000  # hop is widened for longer files
+app.config['MIX_DURATION'] = 2.0  # default length of mixed audio (seconds)
+app.config['MAX_MIX_DURATION'] = 30.0
+app.config['MAX_STREAM_DURATION'] = 10 * 60.0  # /mix-audio/stream never holds the whole clip
+app.config['BATCH_WORKERS'] = os.cpu_count()  # processes used by /analyze-batch
+app.config['MAX_BATCH_FILES'] = 500
+app.config['MAX_BATCH_BYTES'] = 512 * 1024 * 1024  # total unzipped size allowed per batch
+app.config['MAX_BATCH_UPLOAD'] = int(os.environ.get('FFT_MAX_BATCH_UPLOAD_MB', 1024)) * 1024 * 1024  # request size for /analyze-batch
+app.config['MAX_ANALYSES'] = 64  # analyses kept around for /plot, save and mix requests
+app.config['ANALYSIS_TTL'] = 60 * 60  # seconds before an analysis is forgotten
+app.config['ANALYSIS_CACHE_SIZE'] = 128  # repeated uploads answered from memory
+app.config['PLOT_CACHE_SIZE'] = 512  # rendered PNGs kept in memory
+app.config['PLOT_MAX_AGE'] = 24 * 60 * 60  # browser cache lifetime for plots (seconds)
+app.config['METRICS'] = os.environ.get('FFT_METRICS', '1') != '0'  # stage timings and /metrics
 
 # Create uploads folder if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# Store latest analysis results globally for save and mixer functionality
-latest_results = None
-latest_sample_rate = None
+# Analyses by token (each session remembers its latest token), and the
+# plots rendered from them so far
+result_store = make_store(app.config['RESULT_STORE'], app.config['MAX_ANALYSES'],
+                          app.config['ANALYSIS_TTL'])
+plot_cache = LRUCache(app.config['PLOT_CACHE_SIZE'])
+
+# Finished analyses keyed on a hash of the uploaded bytes plus the analysis
+# parameters, so the same sample file isn't analyzed over and over
+analysis_cache = LRUCache(app.config['ANALYSIS_CACHE_SIZE'])
+
+# Request and stage timings, plus cache counters, served at /metrics
+metrics.init_app(app, 'fft', app.config['METRICS'])
+caches = {'analysis': analysis_cache, 'plot': plot_cache}
+metrics.collect('cache_entries', lambda: {(('cache', name),): len(c) for name, c in caches.items()},
+                help='Entries in each in-memory cache')
+metrics.collect('cache_hits_total', lambda: {(('cache', name),): c.hits for name, c in caches.items()},
+                kind='counter', help='Cache lookups that found an entry')
+metrics.collect('cache_misses_total', lambda: {(('cache', name),): c.misses for name, c in caches.items()},
+                kind='counter', help='Cache lookups that found nothing')
+
+# Worker processes for /analyze-batch, started on first use
+batch_pool = None
+
+def get_batch_pool():
+    global batch_pool
+    if batch_pool is None:
+        batch_pool = ProcessPoolExecutor(app.config['BATCH_WORKERS'])
+    return batch_pool
 
-def analyze_audio(file_path):
-    """Perform FFT on audio file and extract top sine wave components"""
+def reset_batch_pool(pool):
+    """Drop a pool broken by a crashed worker so the next batch starts a new one"""
+    global batch_pool
+    if batch_pool is pool:
+        batch_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def save_upload():
+    """Save the uploaded audio_file under a unique temp name
+
+    Returns (file_path, None), or (None, error response) if nothing was uploaded.
+    The caller must remove the file when done.
+    """
+    if 'audio_file' not in request.files:
+        return None, (jsonify({'error': 'No file uploaded'}), 400)
     
-    # Read the audio file
-    sample_rate, data = wavfile.read(file_path)
+    file = request.files['audio_file']
     
-    # Convert to mono if stereo
-    if len(data.shape) > 1:
-        data = data.mean(axis=1)
+    if file.filename == '':
+        return None, (jsonify({'error': 'No file selected'}), 400)
     
-    # Perform FFT
-    n = len(data)
-    yf = fft(data)
-    xf = fftfreq(n, 1 / sample_rate)
+    # Unique name so concurrent uploads don't clash; keep the extension so
+    # decoders can recognise compressed formats
+    suffix = os.path.splitext(file.filename)[1].lower() or '.wav'
+    fd, file_path = tempfile.mkstemp(suffix=suffix, dir=app.config['UPLOAD_FOLDER'])
+    os.close(fd)
+    file.save(file_path)
+    return file_path, None
+
+def current_analysis():
+    """Find the analysis a request refers to: an explicit token, else the session's latest
+
+    Returns (token, analysis), with analysis None if there isn't one.
+    """
+    body = request.get_json(silent=True) or {}
+    token = request.args.get('token') or body.get('token') or session.get('token')
+    if not token:
+        return None, None
+    return token, result_store.get(token)
+
+def component_png(result):
+    """PNG plot for one component"""
+    with metrics.timer('plot'):
+        wave = plots.sine_waves([result['frequency']], [result['magnitude']], [result['phase']])[0]
+        with plots.renderer() as renderer:
+            return renderer.render_png(wave, result['frequency'])
+
+@app.route('/')
+def index():
+    return render_template('index.html')
+
+@app.route('/analyze', methods=['POST'])
+def analyze():
+    try:
+        num_components = int(request.form.get('num_components', app.config['NUM_COMPONENTS']))
+    except ValueError:
+        return jsonify({'error': 'num_components must be a whole number'}), 400
+    num_components = max(1, min(num_components, app.config['MAX_COMPONENTS']))
     
-    # Get positive frequencies only
-    positive_freq_idx = xf > 0
-    xf = xf[positive_freq_idx]
-    yf = yf[positive_freq_idx]
+    # peaks=0 asks for the raw strongest bins instead of distinct peaks
+    peaks = request.form.get('peaks', '1' if app.config['PEAK_PICKING'] else '0') != '0'
     
-    # Get magnitudes
-    magnitudes = np.abs(yf)
+    # Optionally resample while decoding (e.g. resample=16000)
+    try:
+        resample_to = int(request.form['resample']) if request.form.get('resample') else None
+    except ValueError:
+        return jsonify({'error': 'resample must be a sample rate in Hz'}), 400
+    if resample_to is not None and not 1000 <= resample_to <= 192000:
+        return jsonify({'error': 'resample must be between 1000 and 192000 Hz'}), 400
     
-    # Find top 30 frequencies by magnitude
-    top_indices = np.argsort(magnitudes)[-30:][::-1]
+    with metrics.timer('upload'):
+        file_path, error = save_upload()
+    if error:
+        return error
     
-    results = []
-    for idx in top_indices:
-        frequency = xf[idx]
-        magnitude = magnitudes[idx]
-        phase = np.angle(yf[idx])
-        
-        # Generate sine wave plot
-        t = np.linspace(0, 0.05, 1000)  # 50ms of signal
-        sine_wave = magnitude * np.sin(2 * np.pi * frequency * t + phase)
-        
-        # Create plot
-        fig, ax = plt.subplots(figsize=(10, 3))
-        ax.plot(t, sine_wave, 'b-', linewidth=2)
-        ax.set_xlabel('Time (s)')
-        ax.set_ylabel('Amplitude')
-        ax.set_title(f'Frequency: {frequency:.2f} Hz')
-        ax.grid(True, alpha=0.3)
+    # Large files (or an explicit request) use the block-by-block reader
+    streaming = (request.form.get('mode') == 'streaming' or
+                 os.path.getsize(file_path) > app.config['STREAM_THRESHOLD'])
+    
+    try:
+        block_size = app.config['STREAM_BLOCK_SIZE']
+        fast_len = app.config['FFT_FAST_LEN']
+        with metrics.timer('hash'):
+            digest = file_sha256(file_path)
+        cache_key = (f"{digest}:{'streaming' if streaming else 'full'}:"
+                     f"{block_size}:{num_components}:{fast_len}:{peaks}:{resample_to}")
+        cached = analysis_cache.get(cache_key)
         
-        # Convert plot to base64
-        buf = BytesIO()
-        plt.savefig(buf, format='png', dpi=80, bbox_inches='tight')
-        buf.seek(0)
-        img_base64 = base64.b64encode(buf.read()).decode('utf-8')
-        plt.close(fig)
+        if cached is None:
+            # Plots are rendered later, on demand, by /plot/<token>/<index>
+            results, sample_rate = analyze_audio(file_path, streaming=streaming,
+                                                 block_size=block_size, render_plots=False,
+                                                 num_components=num_components, fast_len=fast_len,
+                                                 peaks=peaks, resample_to=resample_to)
+            cached = {'token': uuid.uuid4().hex, 'results': results, 'sample_rate': int(sample_rate)}
+            analysis_cache.set(cache_key, cached)
         
-        # Create equation string
-        equation = f"y(t) = {magnitude:.2f} * sin(2π * {frequency:.2f} * t + {phase:.2f})"
+        # Store results for the plot, save and mixer features. A repeated
+        # upload keeps its old token, so its plots are already cached too.
+        token = cached['token']
+        result_store.set(token, {'results': cached['results'], 'sample_rate': cached['sample_rate']})
+        session['token'] = token
         
-        results.append({
-            'frequency': frequency,
-            'magnitude': magnitude,
-            'equation': equation,
-            'plot': img_base64
-        })
+        with metrics.timer('serialize'):
+            return jsonify({
+                'success': True,
+                'token': token,
+                'sample_rate': cached['sample_rate'],
+                'mode': 'streaming' if streaming else 'full',
+                'results': cached['results']
+            })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        # Clean up temp file
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+def save_batch_uploads(batch_dir):
+    """Save every uploaded audio_files entry, and the audio files inside an uploaded zip
+
+    Returns (paths, names), or raises ValueError if the batch is too big.
+    """
+    paths, names = [], []
+    
+    def add(name, source):
+        if len(paths) >= app.config['MAX_BATCH_FILES']:
+            raise ValueError(f"At most {app.config['MAX_BATCH_FILES']} files per batch")
+        # Numbered names on disk so archive paths can't escape batch_dir
+        suffix = os.path.splitext(name)[1].lower() or '.wav'
+        path = os.path.join(batch_dir, f'{len(paths)}{suffix}')
+        with open(path, 'wb') as f:
+            shutil.copyfileobj(source, f)
+        paths.append(path)
+        names.append(name)
+    
+    for file in request.files.getlist('audio_files'):
+        if file.filename:
+            add(file.filename, file.stream)
     
-    return results, sample_rate
+    archive = request.files.get('archive')
+    if archive and archive.filename:
+        with zipfile.ZipFile(archive.stream) as zf:
+            members = [m for m in zf.infolist()
+                       if not m.is_dir() and m.filename.lower().endswith(decoders.AUDIO_EXTENSIONS)]
+            if sum(m.file_size for m in members) > app.config['MAX_BATCH_BYTES']:
+                raise ValueError('Archive is too large once unzipped')
+            for member in members:
+                with zf.open(member) as source:
+                    add(member.filename, source)
+    
+    return paths, names
 
-@app.route('/')
-def index():
-    return render_template('index.html')
+@app.route('/analyze-batch', methods=['POST'])
+def analyze_batch():
+    """Analyze many files at once, streaming one JSON line per file as each finishes
 
-@app.route('/analyze', methods=['POST'])
-def analyze():
-    global latest_results, latest_sample_rate
+    Upload files as audio_files (repeated) and/or a zip as archive. Plots are
+    only rendered when plots=1.
+    """
+    try:
+        num_components = int(request.form.get('num_components', app.config['NUM_COMPONENTS']))
+    except ValueError:
+        return jsonify({'error': 'num_components must be a whole number'}), 400
+    options = {
+        'render_plots': request.form.get('plots') == '1',
+        'num_components': max(1, min(num_components, app.config['MAX_COMPONENTS'])),
+        'peaks': request.form.get('peaks', '1' if app.config['PEAK_PICKING'] else '0') != '0',
+        'fast_len': app.config['FFT_FAST_LEN'],
+        'block_size': app.config['STREAM_BLOCK_SIZE'],
+        'stream_threshold': app.config['STREAM_THRESHOLD']
+    }
     
-    if 'audio_file' not in request.files:
-        return jsonify({'error': 'No file uploaded'}), 400
+    batch_dir = tempfile.mkdtemp(dir=app.config['UPLOAD_FOLDER'])
+    try:
+        paths, names = save_batch_uploads(batch_dir)
+    except (ValueError, zipfile.BadZipFile) as e:
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        return jsonify({'error': str(e)}), 400
+    if not paths:
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        return jsonify({'error': 'No files uploaded'}), 400
     
-    file = request.files['audio_file']
+    def generate():
+        records = batch.run_batch(get_batch_pool(), paths, options, names, on_broken=reset_batch_pool)
+        try:
+            for record in records:
+                yield json.dumps(record) + '\n'
+        finally:
+            # Cancel the files not started yet before deleting them
+            records.close()
+            shutil.rmtree(batch_dir, ignore_errors=True)
     
-    if file.filename == '':
-        return jsonify({'error': 'No file selected'}), 400
+    return Response(generate(), mimetype='application/x-ndjson')
+
+@app.route('/spectrogram', methods=['POST'])
+def spectrogram():
+    """Short-time FFT of an upload, as a PNG image or a quantized uint8 array
+
+    Form fields: n_fft (window length), hop, window (e.g. hann, hamming) and
+    format ('png' or 'array').
+    """
+    try:
+        n_fft = int(request.form.get('n_fft', 1024))
+        hop = int(request.form.get('hop', n_fft // 4))
+    except ValueError:
+        return jsonify({'error': 'n_fft and hop must be whole numbers'}), 400
+    window = request.form.get('window', 'hann')
+    output_format = request.form.get('format', 'png')
     
-    # Save the file temporarily
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], 'temp_audio.wav')
-    file.save(file_path)
+    if not 64 <= n_fft <= 16384:
+        return jsonify({'error': 'n_fft must be between 64 and 16384'}), 400
+    if not 1 <= hop <= n_fft:
+        return jsonify({'error': 'hop must be between 1 and n_fft'}), 400
+    if output_format not in ('png', 'array'):
+        return jsonify({'error': "format must be 'png' or 'array'"}), 400
+    
+    with metrics.timer('upload'):
+        file_path, error = save_upload()
+    if error:
+        return error
     
     try:
-        results, sample_rate = analyze_audio(file_path)
+        with metrics.timer('decode'):
+            sample_rate, data = decoders.decode(file_path)
         
-        # Store results globally for save and mixer features
-        latest_results = results
-        latest_sample_rate = sample_rate
+        # Keep the number of frames bounded for long recordings
+        max_frames = app.config['SPECTROGRAM_MAX_FRAMES']
+        hop = max(hop, -(-(len(data) - n_fft) // max_frames))
+        
+        try:
+            with metrics.timer('stft'):
+                times, freqs, magnitudes = spectrum.spectrogram(data, sample_rate, n_fft, hop, window)
+                image = spectrum.quantize_db(magnitudes)
+        except ValueError as e:
+            return jsonify({'error': f'Bad window: {e}'}), 400
+        
+        if output_format == 'png':
+            # Time runs left to right, low frequencies at the bottom
+            buf = BytesIO()
+            with metrics.timer('encode_png'):
+                plt.imsave(buf, image.T, cmap='magma', origin='lower', format='png')
+            response = make_response(buf.getvalue())
+            response.mimetype = 'image/png'
+            response.headers['X-Hop'] = str(hop)
+            response.headers['X-Sample-Rate'] = str(int(sample_rate))
+            return response
         
         return jsonify({
             'success': True,
             'sample_rate': int(sample_rate),
-            'results': results
+            'n_fft': n_fft,
+            'hop': hop,
+            'time_step': hop / sample_rate,
+            'freq_step': float(freqs[1]),
+            'db_range': 80,
+            'shape': list(image.shape),  # [frames, frequency bins]
+            'data': base64.b64encode(image.tobytes()).decode('utf-8')
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
-        # Clean up temp file
         if os.path.exists(file_path):
             os.remove(file_path)
 
+@app.route('/plot/<token>/<int:index>')
+def plot(token, index):
+    """Render one component plot, caching it for later requests"""
+    # Plots never change for a given token, so the ETag can be built up front
+    etag = f'{token}-{index}'
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+    else:
+        png = plot_cache.get(etag)
+        if png is None:
+            analysis = result_store.get(token)
+            if analysis is None:
+                return jsonify({'error': 'Unknown or expired analysis'}), 404
+            results = analysis['results']
+            if not 0 <= index < len(results):
+                return jsonify({'error': 'No such component'}), 404
+            png = component_png(results[index])
+            plot_cache.set(etag, png)
+        
+        response = make_response(png)
+        response.mimetype = 'image/png'
+    
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = app.config['PLOT_MAX_AGE']
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/cache-stats')
+def cache_stats():
+    """Hit/miss counters for the analysis and plot caches"""
+    return jsonify({
+        'analysis_cache': analysis_cache.stats(),
+        'plot_cache': plot_cache.stats()
+    })
+
 @app.route('/save-results', methods=['GET'])
 def save_results():
-    """Save all graphs and equations to a PDF file"""
-    global latest_results, latest_sample_rate
-    
-    if not latest_results:
+    """All graphs and equations as a PDF file"""
+    token, analysis = current_analysis()
+    if not analysis:
         return jsonify({'error': 'No results to save'}), 400
+    results = analysis['results']
     
-    try:
-        from matplotlib.backends.backend_pdf import PdfPages
-        
-        # Create PDF
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], f'fft_results_{timestamp}.pdf')
-        
-        with PdfPages(pdf_path) as pdf:
-            # Title page
-            fig = plt.figure(figsize=(11, 8.5))
-            fig.text(0.5, 0.7, 'Audio FFT Analysis Results', 
-                    ha='center', fontsize=24, fontweight='bold')
-            fig.text(0.5, 0.6, f'Sample Rate: {latest_sample_rate} Hz', 
-                    ha='center', fontsize=14)
-            fig.text(0.5, 0.5, f'Top 30 Sine Wave Components', 
-                    ha='center', fontsize=14)
-            fig.text(0.5, 0.4, f'Generated: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}', 
-                    ha='center', fontsize=12, style='italic')
-            plt.axis('off')
-            pdf.savefig(fig, bbox_inches='tight')
-            plt.close(fig)
-            
-            # Create pages with graphs and equations
-            for idx, result in enumerate(latest_results):
-                fig, ax = plt.subplots(figsize=(11, 8.5))
-                
-                # Regenerate the sine wave
-                frequency = result['frequency']
-                magnitude = result['magnitude']
-                phase = np.angle(complex(result.get('real', 1), result.get('imag', 0))) if 'real' in result else 0
-                
-                t = np.linspace(0, 0.05, 1000)
-                sine_wave = magnitude * np.sin(2 * np.pi * frequency * t + phase)
-                
-                # Plot
-                ax.plot(t, sine_wave, 'b-', linewidth=2)
-                ax.set_xlabel('Time (s)', fontsize=12)
-                ax.set_ylabel('Amplitude', fontsize=12)
-                ax.set_title(f'Component #{idx + 1} - Frequency: {frequency:.2f} Hz', 
-                           fontsize=16, fontweight='bold', pad=20)
-                ax.grid(True, alpha=0.3)
-                
-                # Add equation as text
-                equation_text = result['equation']
-                ax.text(0.5, -0.15, equation_text, 
-                       transform=ax.transAxes, 
-                       fontsize=11, 
-                       ha='center',
-                       bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
-                
-                plt.tight_layout()
-                pdf.savefig(fig, bbox_inches='tight')
-                plt.close(fig)
-        
-        # Send the file
-        return send_file(pdf_path, 
-                        as_attachment=True, 
-                        download_name=f'fft_results_{timestamp}.pdf',
-                        mimetype='application/pdf')
+    # Vector pages, built in memory (or a temp file for very big reports)
+    now = datetime.now()
+    with metrics.timer('pdf'):
+        report = plots.pdf_report(results, analysis['sample_rate'], now)
     
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    return send_file(report, mimetype='application/pdf', as_attachment=True,
+                     download_name=f'fft_results_{now.strftime("%Y%m%d_%H%M%S")}.pdf')
+
+def selected_components(results, selected_indices):
+    """(frequencies, magnitudes, phases) of the chosen components, skipping bad indices"""
+    chosen = [results[idx] for idx in selected_indices
+              if isinstance(idx, int) and 0 <= idx < len(results)]
+    return ([r['frequency'] for r in chosen], [r['magnitude'] for r in chosen],
+            [r['phase'] for r in chosen])
 
 @app.route('/mix-audio', methods=['POST'])
 def mix_audio():
     """Create audio from selected sine wave components"""
-    global latest_results, latest_sample_rate
-    
-    if not latest_results:
+    token, analysis = current_analysis()
+    if not analysis:
         return jsonify({'error': 'No results available'}), 400
+    results = analysis['results']
     
     try:
         data = request.json
@@ -209,51 +438,21 @@ def mix_audio():
         if not selected_indices:
             return jsonify({'error': 'No components selected'}), 400
         
-        # Audio parameters
-        duration = 2.0  # 2 seconds
-        sample_rate = latest_sample_rate or 44100
-        t = np.linspace(0, duration, int(sample_rate * duration))
-        
-        # Mix selected sine waves
-        mixed_audio = np.zeros_like(t)
-        
-        for idx in selected_indices:
-            if 0 <= idx < len(latest_results):
-                result = latest_results[idx]
-                frequency = result['frequency']
-                magnitude = result['magnitude']
-                phase = np.angle(complex(result.get('real', 1), result.get('imag', 0))) if 'real' in result else 0
-                
-                # Add this component
-                mixed_audio += magnitude * np.sin(2 * np.pi * frequency * t + phase)
-        
-        # Normalize to prevent clipping
-        if mixed_audio.max() > 0:
-            mixed_audio = mixed_audio / mixed_audio.max() * 0.8
-        
-        # Apply fade in/out to avoid clicks
-        fade_samples = int(0.01 * sample_rate)  # 10ms fade
-        fade_in = np.linspace(0, 1, fade_samples)
-        fade_out = np.linspace(1, 0, fade_samples)
-        mixed_audio[:fade_samples] *= fade_in
-        mixed_audio[-fade_samples:] *= fade_out
-        
-        # Convert to 16-bit PCM
-        audio_int16 = (mixed_audio * 32767).astype(np.int16)
-        
-        # Save to temporary file
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        audio_path = os.path.join(app.config['UPLOAD_FOLDER'], f'mixed_audio_{timestamp}.wav')
-        wavfile.write(audio_path, sample_rate, audio_int16)
+        try:
+            duration = float(data.get('duration', app.config['MIX_DURATION']))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'duration must be a number of seconds'}), 400
+        if not 0 < duration <= app.config['MAX_MIX_DURATION']:
+            return jsonify({'error': f"duration must be between 0 and {app.config['MAX_MIX_DURATION']} seconds"}), 400
         
-        # Read file and convert to base64
-        with open(audio_path, 'rb') as f:
-            audio_data = f.read()
+        sample_rate = analysis['sample_rate'] or 44100
+        frequencies, magnitudes, phases = selected_components(results, selected_indices)
         
-        audio_base64 = base64.b64encode(audio_data).decode('utf-8')
-        
-        # Clean up
-        os.remove(audio_path)
+        # Sum the selected sine waves straight into an in-memory WAV file
+        with metrics.timer('synthesize'):
+            audio_data = synth.mix_to_wav(frequencies, magnitudes, phases, sample_rate, duration)
+        with metrics.timer('serialize'):
+            audio_base64 = base64.b64encode(audio_data).decode('utf-8')
         
         return jsonify({
             'success': True,
@@ -264,5 +463,49 @@ def mix_audio():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Formats /mix-audio/stream can produce; ogg and flac need the soundfile package
+STREAM_FORMATS = {'wav': 'audio/wav', 'ogg': 'audio/ogg', 'flac': 'audio/flac'}
+
+@app.route('/mix-audio/stream')
+def mix_audio_stream():
+    """Stream mixed audio as it is synthesized, so playback can start right away
+
+    Query parameters: indices (comma separated), duration (seconds),
+    format (wav, ogg or flac) and optionally token.
+    """
+    token, analysis = current_analysis()
+    if not analysis:
+        return jsonify({'error': 'No results available'}), 400
+    
+    try:
+        selected_indices = [int(i) for i in request.args.get('indices', '').split(',') if i.strip()]
+        duration = float(request.args.get('duration', app.config['MIX_DURATION']))
+    except ValueError:
+        return jsonify({'error': 'indices must be whole numbers and duration a number'}), 400
+    output_format = request.args.get('format', 'wav')
+    
+    if not selected_indices:
+        return jsonify({'error': 'No components selected'}), 400
+    if not 0 < duration <= app.config['MAX_STREAM_DURATION']:
+        return jsonify({'error': f"duration must be between 0 and {app.config['MAX_STREAM_DURATION']} seconds"}), 400
+    if output_format not in STREAM_FORMATS:
+        return jsonify({'error': 'format must be wav, ogg or flac'}), 400
+    
+    sample_rate = analysis['sample_rate'] or 44100
+    frequencies, magnitudes, phases = selected_components(analysis['results'], selected_indices)
+    bank = synth.OscillatorBank(frequencies, magnitudes, phases, sample_rate)
+    num_samples = int(sample_rate * duration)
+    
+    if output_format == 'wav':
+        chunks = synth.stream_wav(bank, num_samples)
+    else:
+        try:
+            import soundfile  # noqa: F401
+        except ImportError:
+            return jsonify({'error': f'{output_format} output needs the soundfile package'}), 400
+        chunks = synth.stream_encoded(bank, num_samples, output_format.upper())
+    
+    return Response(chunks, mimetype=STREAM_FORMATS[output_format])
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5001)
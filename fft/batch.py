@@ -0,0 +1,169 @@
+"""
+Analyze many audio files at once, spread over several processes
+
+Usage:
+    python batch.py samples/ > results.ndjson
+    python batch.py samples/ more.wav --format csv --output results.csv
+    python batch.py samples/ --format parquet --output results.parquet --workers 8
+
+Results are written as each file finishes. Plots are skipped unless --plots
+is given.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from analysis import analyze_audio
+from decoders import AUDIO_EXTENSIONS
+
+CSV_FIELDS = ['file', 'sample_rate', 'rank', 'frequency', 'magnitude', 'phase', 'error']
+
+
+def find_audio_files(inputs, extensions=AUDIO_EXTENSIONS):
+    """Expand directories into the audio files inside them (recursively)"""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                paths.extend(os.path.join(root, f) for f in sorted(files)
+                             if f.lower().endswith(extensions))
+        else:
+            paths.append(item)
+    return paths
+
+
+def analyze_file(path, options, name=None):
+    """Analyze one file in a worker process, never raising
+
+    `options` are passed to analyze_audio, except `stream_threshold`: files
+    bigger than that many bytes are analyzed in streaming mode.
+    """
+    options = dict(options)
+    threshold = options.pop('stream_threshold', None)
+    if threshold is not None:
+        options['streaming'] = os.path.getsize(path) > threshold
+    try:
+        results, sample_rate = analyze_audio(path, **options)
+        return {'file': name or path, 'sample_rate': int(sample_rate), 'results': results}
+    except Exception as e:
+        return {'file': name or path, 'error': str(e)}
+
+
+def run_batch(executor, paths, options, names=None, on_broken=None):
+    """Yield each file's result as soon as it finishes (not in input order)
+
+    A worker process that dies (e.g. killed for using too much memory)
+    breaks the whole executor. Every file it still held then gets an error
+    record, and `on_broken(executor)` is called once so the caller can
+    replace it.
+    """
+    names = names or paths
+    futures = {}
+    broken = []
+
+    def crashed(name):
+        if not broken and on_broken is not None:
+            on_broken(executor)
+        broken.append(name)
+        return {'file': name, 'error': 'A worker process crashed; try this file again'}
+
+    try:
+        for path, name in zip(paths, names):
+            try:
+                futures[executor.submit(analyze_file, path, options, name)] = name
+            except BrokenProcessPool:
+                yield crashed(name)
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except BrokenProcessPool:
+                yield crashed(futures[future])
+    finally:
+        # If the caller stops early (e.g. the client disconnected), files
+        # that haven't started yet are dropped instead of analyzed for nobody
+        for future in futures:
+            future.cancel()
+
+
+def csv_rows(record):
+    """One CSV row per component (or a single row holding the error)"""
+    if 'error' in record:
+        return [{'file': record['file'], 'error': record['error']}]
+    return [{'file': record['file'], 'sample_rate': record['sample_rate'], 'rank': rank,
+             'frequency': r['frequency'], 'magnitude': r['magnitude'], 'phase': r['phase']}
+            for rank, r in enumerate(record['results'], start=1)]
+
+
+def write_ndjson(records, out):
+    for record in records:
+        out.write(json.dumps(record) + '\n')
+        out.flush()
+
+
+def write_csv(records, out):
+    writer = csv.DictWriter(out, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    for record in records:
+        writer.writerows(csv_rows(record))
+        out.flush()
+
+
+def write_parquet(records, path):
+    """Write one Parquet row group per file (needs pyarrow)"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([('file', pa.string()), ('sample_rate', pa.int64()), ('rank', pa.int64()),
+                        ('frequency', pa.float64()), ('magnitude', pa.float64()),
+                        ('phase', pa.float64()), ('error', pa.string())])
+    with pq.ParquetWriter(path, schema) as writer:
+        for record in records:
+            rows = csv_rows(record)
+            columns = {field: [row.get(field) for row in rows] for field in CSV_FIELDS}
+            writer.write_table(pa.table(columns, schema=schema))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analyze many audio files with the FFT analyzer')
+    parser.add_argument('inputs', nargs='+', help='audio files or directories')
+    parser.add_argument('--format', choices=['ndjson', 'csv', 'parquet'], default='ndjson')
+    parser.add_argument('--output', help='output file (default: stdout; required for parquet)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--num-components', type=int, default=30)
+    parser.add_argument('--raw-bins', action='store_true', help='report top bins instead of peaks')
+    parser.add_argument('--plots', action='store_true', help='include base64 PNG plots (ndjson only)')
+    parser.add_argument('--stream-threshold', type=int, default=4 * 1024 * 1024,
+                        help='files bigger than this many bytes are analyzed in streaming mode')
+    args = parser.parse_args(argv)
+
+    if args.format == 'parquet' and not args.output:
+        parser.error('--output is required for parquet')
+
+    paths = find_audio_files(args.inputs)
+    options = {'render_plots': args.plots and args.format == 'ndjson',
+               'num_components': args.num_components,
+               'peaks': not args.raw_bins,
+               'stream_threshold': args.stream_threshold}
+
+    with ProcessPoolExecutor(args.workers) as executor:
+        records = run_batch(executor, paths, options)
+        if args.format == 'parquet':
+            write_parquet(records, args.output)
+            return
+        out = open(args.output, 'w', newline='') if args.output else sys.stdout
+        try:
+            if args.format == 'csv':
+                write_csv(records, out)
+            else:
+                write_ndjson(records, out)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+"""
+Benchmarks for the FFT analyzer
+
+Usage:
+    python benchmark.py plots [--repeats N]
+    python benchmark.py mix [--repeats N]
+    python benchmark.py suite [--durations 0.5 5 30 180] [--save-baseline FILE]
+    python benchmark.py suite --baseline FILE [--threshold 0.25]
+
+The suite times each stage of an analysis (decode, FFT, peak picking,
+plotting, JSON encoding) and the /analyze, /save-results and /mix-audio
+routes on generated files of increasing length, recording peak memory too.
+With --baseline it exits with status 1 if any stage got slower, or its peak
+memory grew, by more than the threshold allows.
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+import plots
+import synth
+import spectrum
+import decoders
+import generate_samples
+from analysis import analyze_audio
+
+
+def random_components(n=30, seed=0):
+    """Frequencies, magnitudes and phases that look like a real analysis"""
+    rng = np.random.default_rng(seed)
+    frequencies = rng.uniform(20, 5000, n)
+    magnitudes = np.sort(rng.uniform(1, 1000, n))[::-1]
+    phases = rng.uniform(-np.pi, np.pi, n)
+    return frequencies, magnitudes, phases
+
+
+def render_legacy(frequencies, magnitudes, phases):
+    """The original renderer: one new pyplot figure per component"""
+    images = []
+    for frequency, magnitude, phase in zip(frequencies, magnitudes, phases):
+        t = np.linspace(0, 0.05, 1000)
+        sine_wave = magnitude * np.sin(2 * np.pi * frequency * t + phase)
+
+        fig, ax = plt.subplots(figsize=(10, 3))
+        ax.plot(t, sine_wave, 'b-', linewidth=2)
+        ax.set_xlabel('Time (s)')
+        ax.set_ylabel('Amplitude')
+        ax.set_title(f'Frequency: {frequency:.2f} Hz')
+        ax.grid(True, alpha=0.3)
+
+        buf = BytesIO()
+        plt.savefig(buf, format='png', dpi=80, bbox_inches='tight')
+        buf.seek(0)
+        images.append(base64.b64encode(buf.read()).decode('utf-8'))
+        plt.close(fig)
+    return images
+
+
+def mix_legacy(frequencies, magnitudes, phases, sample_rate, duration=2.0):
+    """The original mixer: a float64 np.sin over the whole timeline per component"""
+    t = np.linspace(0, duration, int(sample_rate * duration))
+    mixed_audio = np.zeros_like(t)
+    for frequency, magnitude, phase in zip(frequencies, magnitudes, phases):
+        mixed_audio += magnitude * np.sin(2 * np.pi * frequency * t + phase)
+    if mixed_audio.max() > 0:
+        mixed_audio = mixed_audio / mixed_audio.max() * 0.8
+    return (mixed_audio * 32767).astype(np.int16)
+
+
+def time_it(func, repeats):
+    """Run func `repeats` times after one warmup call, returning times in ms"""
+    func()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    return np.array(times)
+
+
+def report(name, times):
+    print(f"  {name:<24} mean {times.mean():8.1f} ms   min {times.min():8.1f} ms")
+
+
+def bench_plots(repeats):
+    frequencies, magnitudes, phases = random_components()
+    renderer = plots.ComponentRenderer()
+
+    print(f"Rendering 30 component plots per request ({repeats} requests)")
+    before = time_it(lambda: render_legacy(frequencies, magnitudes, phases), repeats)
+    after = time_it(lambda: renderer.render_all(frequencies, magnitudes, phases), repeats)
+    report('before (figure per plot)', before)
+    report('after (reused figure)', after)
+    print(f"  speedup: {before.mean() / after.mean():.1f}x")
+
+
+def bench_mix(repeats):
+    frequencies, magnitudes, phases = random_components()
+
+    print(f"Mixing 2 s of audio ({repeats} requests per case)")
+    print(f"  {'rate':>6} {'components':>10} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    for sample_rate in (44100, 48000, 96000):
+        for n in (1, 5, 10, 20, 30):
+            args = (frequencies[:n], magnitudes[:n], phases[:n], sample_rate)
+            before = time_it(lambda: mix_legacy(*args), repeats)
+            after = time_it(lambda: synth.mix_to_wav(*args), repeats)
+            print(f"  {sample_rate:>6} {n:>10} {before.mean():>10.1f} {after.mean():>10.1f} "
+                  f"{before.mean() / after.mean():>7.1f}x")
+
+
+def measure(func, repeats):
+    """Median time (ms) and traced peak memory (MB) of func -> (its result, ms, MB)"""
+    result = func()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, float(np.median(times)), peak / 1024 / 1024
+
+
+def suite_file(directory, duration):
+    """A harmonics-rich test file of the given length"""
+    spec = {'name': f'suite_{duration:g}s', 'type': 'harmonics', 'fundamental': 220,
+            'harmonics': 12, 'duration': duration}
+    return generate_samples.write_sample(spec, directory)
+
+
+def stage_timings(path, repeats):
+    """Time every stage of the analysis of one file, plus the HTTP routes"""
+    # Imported here so the other benchmarks don't need the Flask app
+    import app as fft_app
+
+    stages = {}
+
+    def run(name, func):
+        result, ms, mb = measure(func, repeats)
+        stages[name] = {'ms': round(ms, 3), 'peak_mb': round(mb, 3)}
+        return result
+
+    sample_rate, samples = run('decode', lambda: decoders.decode(path))
+    xf, magnitudes, phases = run('fft', lambda: spectrum.real_spectrum(
+        samples, sample_rate, fast_len=True, window='hann'))
+    peaks = run('peak_pick', lambda: spectrum.pick_peaks(xf, magnitudes, phases, 30))
+
+    def plot():
+        with plots.renderer() as renderer:
+            return renderer.render_all(*peaks)
+    run('plotting', plot)
+
+    results, _ = analyze_audio(path, render_plots=False)
+    run('json_encode', lambda: json.dumps({'success': True, 'results': results}))
+
+    client = fft_app.app.test_client()
+
+    def analyze_request():
+        # Skip the content-hash cache so the real work is measured every time
+        fft_app.analysis_cache.clear()
+        with open(path, 'rb') as f:
+            return client.post('/analyze', data={'audio_file': (f, os.path.basename(path))})
+
+    run('analyze_request', analyze_request)
+    run('save_results_request', lambda: client.get('/save-results').data)
+    run('mix_audio_request', lambda: client.post('/mix-audio',
+                                                 json={'selected_indices': list(range(10))}))
+    return stages
+
+
+def compare(current, baseline, threshold, min_ms=2.0, min_mb=1.0):
+    """Stages slower (or with a higher peak memory) than the baseline by more than threshold
+
+    Differences under min_ms / min_mb are ignored as noise.
+    """
+    regressions = []
+    for name, stages in current.items():
+        for stage, result in stages.items():
+            before = baseline.get(name, {}).get(stage)
+            if before is None:
+                continue
+            if result['ms'] > before['ms'] * (1 + threshold) and result['ms'] - before['ms'] > min_ms:
+                regressions.append(f"{name} {stage}: {before['ms']:.1f} ms -> {result['ms']:.1f} ms")
+            if (result['peak_mb'] > before['peak_mb'] * (1 + threshold) and
+                    result['peak_mb'] - before['peak_mb'] > min_mb):
+                regressions.append(f"{name} {stage}: {before['peak_mb']:.1f} MB -> {result['peak_mb']:.1f} MB peak")
+    return regressions
+
+
+def bench_suite(durations, repeats, save_baseline=None, baseline=None, threshold=0.25):
+    current = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for duration in durations:
+            name = f'{duration:g}s'
+            print(f"{name} file")
+            current[name] = stage_timings(suite_file(directory, duration), repeats)
+            for stage, result in current[name].items():
+                print(f"  {stage:<22} {result['ms']:10.1f} ms {result['peak_mb']:10.1f} MB peak")
+
+    if save_baseline:
+        with open(save_baseline, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f"Saved baseline to {save_baseline}")
+
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(current, json.load(f), threshold)
+        if regressions:
+            print(f"Regressions (more than {threshold:.0%} slower or bigger than {baseline}):")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No stage's time or peak memory regressed by more than {threshold:.0%}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the FFT analyzer')
+    parser.add_argument('benchmark', choices=['plots', 'mix', 'suite'])
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--durations', type=float, nargs='+', default=[0.5, 5, 30, 180],
+                        help='suite: lengths of the test files in seconds')
+    parser.add_argument('--save-baseline', help='suite: write the timings to this file')
+    parser.add_argument('--baseline', help='suite: compare against this baseline file')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='suite: allowed slowdown or memory growth before failing (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    if args.benchmark == 'plots':
+        bench_plots(args.repeats)
+    elif args.benchmark == 'mix':
+        bench_mix(args.repeats)
+    elif args.benchmark == 'suite':
+        bench_suite(args.durations, args.repeats, args.save_baseline, args.baseline, args.threshold)
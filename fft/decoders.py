@@ -0,0 +1,197 @@
+"""
+Audio decoding for the FFT analyzer
+
+WAV files are read with scipy. Compressed formats (FLAC, OGG, MP3, ...) are
+decoded incrementally with the soundfile package, or PyAV (ffmpeg) if
+soundfile can't read them. Either way the result is mono float32 blocks.
+
+Decoded samples are scaled to 16-bit units, so a sound gives the same
+magnitudes whether it was uploaded as a 16-bit WAV or a compressed file.
+"""
+from math import gcd
+
+import numpy as np
+from scipy.signal import firwin, upfirdn
+
+import spectrum
+
+PCM16_SCALE = 32768
+
+# File types the analyzer accepts (anything soundfile or ffmpeg decodes works)
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.ogg', '.mp3')
+
+
+def is_wav(file_path):
+    with open(file_path, 'rb') as f:
+        return f.read(4) in (b'RIFF', b'RIFX', b'RF64')
+
+
+class StreamingResampler:
+    """Polyphase resampler that works block by block.
+
+    Uses the same anti-aliasing filter as scipy.signal.resample_poly, keeps
+    just enough input history between blocks for the filter, and removes
+    the filter delay so output lines up with the input.
+    """
+
+    def __init__(self, rate_in, rate_out):
+        g = gcd(int(rate_in), int(rate_out))
+        self.up = int(rate_out) // g
+        self.down = int(rate_in) // g
+        max_rate = max(self.up, self.down)
+        half_len = 10 * max_rate
+        h = firwin(2 * half_len + 1, 1 / max_rate, window=('kaiser', 5.0)) * self.up
+        # Pad the front of the filter so its delay is a whole number of output samples
+        pre_pad = self.down - half_len % self.down
+        self.h = np.concatenate([np.zeros(pre_pad), h])
+        self.delay = (half_len + pre_pad) // self.down  # output samples of filter delay to skip
+
+        self._x = np.empty(0, dtype=np.float32)
+        self._start = 0  # global input index of _x[0]; always a multiple of down
+        self._next = 0  # next global output index to produce
+        self._total_in = 0
+
+    def _produce(self, last):
+        """Outputs _next..last (inclusive), computed from the buffered input"""
+        if last < self._next:
+            return np.empty(0, dtype=np.float32)
+        y = upfirdn(self.h, self._x, self.up, self.down)
+        base = self._start * self.up // self.down
+        out = y[self._next - base:last - base + 1]
+        if len(out) < last - self._next + 1:
+            out = np.pad(out, (0, last - self._next + 1 - len(out)))
+        self._next = last + 1
+        return out.astype(np.float32)
+
+    def _trim(self):
+        # Drop input the next output no longer needs, keeping _start aligned
+        needed = max(0, (self._next * self.down - len(self.h) + 1) // self.up)
+        new_start = needed // self.down * self.down
+        if new_start > self._start:
+            self._x = self._x[new_start - self._start:]
+            self._start = new_start
+
+    def _skip_delay(self, out):
+        # The first `delay` outputs are just the filter warming up
+        skip = max(0, self.delay - (self._next - len(out)))
+        return out[skip:]
+
+    def feed(self, block):
+        self._x = np.concatenate([self._x, block])
+        self._total_in += len(block)
+        # Output n only needs inputs up to n * down / up (plus the filter delay)
+        last = ((self._total_in - 1) * self.up) // self.down
+        out = self._skip_delay(self._produce(last))
+        self._trim()
+        return out
+
+    def finish(self):
+        total_out = -(-self._total_in * self.up // self.down)
+        out = self._skip_delay(self._produce(total_out + self.delay - 1))
+        return out
+
+
+def _soundfile_blocks(file_path, block_size):
+    import soundfile
+
+    f = soundfile.SoundFile(file_path)
+
+    def blocks():
+        with f:
+            while True:
+                block = f.read(block_size, dtype='float32', always_2d=True)
+                if not len(block):
+                    break
+                yield block.mean(axis=1) * PCM16_SCALE
+
+    return f.samplerate, blocks()
+
+
+def _av_blocks(file_path, target_rate):
+    import av
+
+    container = av.open(file_path)
+    stream = container.streams.audio[0]
+    rate = target_rate or stream.codec_context.sample_rate
+    # ffmpeg downmixes and resamples for us as frames are decoded
+    resampler = av.AudioResampler(format='flt', layout='mono', rate=rate)
+
+    def blocks():
+        with container:
+            for frame in container.decode(stream):
+                for out in resampler.resample(frame):
+                    yield out.to_ndarray().reshape(-1) * PCM16_SCALE
+            for out in resampler.resample(None):
+                yield out.to_ndarray().reshape(-1) * PCM16_SCALE
+
+    return rate, blocks()
+
+
+def _with_av_fallback(file_path, blocks, sample_rate):
+    """Yield soundfile's blocks; if it fails partway, carry on from the same sample with ffmpeg
+
+    Some files open fine but fail while being read (e.g. a FLAC whose header
+    leaves the length unknown), which happens after decode_blocks returned.
+    """
+    done = 0
+    try:
+        for block in blocks:
+            done += len(block)
+            yield block
+        return
+    except RuntimeError as e:
+        error = e
+    try:
+        _, rest = _av_blocks(file_path, sample_rate)
+    except ImportError:
+        raise error
+    for block in rest:
+        if done >= len(block):
+            done -= len(block)
+            continue
+        yield block[done:]
+        done = 0
+
+
+def _resampled(blocks, rate_in, rate_out):
+    resampler = StreamingResampler(rate_in, rate_out)
+    for block in blocks:
+        out = resampler.feed(block)
+        if len(out):
+            yield out
+    yield resampler.finish()
+
+
+def decode_blocks(file_path, block_size=8192, target_rate=None):
+    """Decode an audio file into mono float32 blocks -> (sample_rate, generator)
+
+    If `target_rate` is given the blocks are resampled to it as they are decoded.
+    """
+    if is_wav(file_path):
+        sample_rate, blocks = spectrum.read_wav_blocks(file_path, block_size)
+    else:
+        try:
+            sample_rate, blocks = _soundfile_blocks(file_path, block_size)
+            blocks = _with_av_fallback(file_path, blocks, sample_rate)
+        except (ImportError, RuntimeError):
+            # soundfile missing or it can't read this format; try ffmpeg
+            try:
+                return _av_blocks(file_path, target_rate)
+            except ImportError:
+                raise ValueError('Only .wav files are supported without the soundfile '
+                                 'or av packages installed')
+
+    if target_rate and target_rate != sample_rate:
+        return target_rate, _resampled(blocks, sample_rate, target_rate)
+    return sample_rate, blocks
+
+
+def decode(file_path, target_rate=None):
+    """Decode a whole audio file into one mono float32 array -> (sample_rate, samples)"""
+    if is_wav(file_path) and not target_rate:
+        # Memory-mapped read, no intermediate blocks
+        return spectrum.read_mono(file_path)
+    sample_rate, blocks = decode_blocks(file_path, target_rate=target_rate)
+    chunks = list(blocks)
+    samples = np.concatenate(chunks) if chunks else np.empty(0, dtype=np.float32)
+    return sample_rate, samples.astype(np.float32, copy=False)
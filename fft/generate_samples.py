@@ -1,91 +1,180 @@
 """
 Generate sample audio files for testing the FFT analyzer
+
+    python generate_samples.py                       # the four classic samples
+    python generate_samples.py --corpus corpus/ --count 200 --seed 1
+    python generate_samples.py --spec my_spec.json --corpus corpus/
+
+A corpus is described by a list of specs, one per file, e.g.
+    {"name": "a440", "type": "tone", "frequencies": [440], "duration": 0.5}
+Types: tone/chord (sine waves, optional "amplitudes"), harmonics
+("fundamental" and "harmonics"), sweep ("start", "end") and noise. Every
+spec can also set "sample_rate" (default 44100) and "seed".
 """
+import argparse
+import json
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
-from scipy.io import wavfile
+from scipy.signal import chirp
+
+import synth
+
+BLOCK_SIZE = 65536
+
+
+def _sine_spec(spec):
+    """Frequencies and amplitudes for the sine-based spec types"""
+    if spec['type'] == 'harmonics':
+        harmonics = np.arange(1, spec.get('harmonics', 7) + 1)
+        return spec['fundamental'] * harmonics, 1.0 / harmonics
+    frequencies = np.asarray(spec['frequencies'], dtype=float)
+    amplitudes = np.asarray(spec.get('amplitudes', np.ones(len(frequencies))), dtype=float)
+    return frequencies, amplitudes
+
+def signal_blocks(spec):
+    """Yield the spec's signal as float32 blocks in [-1, 1], envelope applied
+
+    Sine-based sounds come from the oscillator bank, so all frequencies are
+    computed together and multi-minute files never sit in memory at once.
+    """
+    sample_rate = spec.get('sample_rate', 44100)
+    duration = spec['duration']
+    num_samples = int(sample_rate * duration)
+    kind = spec['type']
+
+    if kind in ('tone', 'chord', 'harmonics'):
+        frequencies, amplitudes = _sine_spec(spec)
+        bank = synth.OscillatorBank(frequencies, amplitudes / amplitudes.sum(),
+                                    np.zeros(len(frequencies)), sample_rate, BLOCK_SIZE)
+        blocks = bank.blocks(num_samples)
+    elif kind == 'sweep':
+        blocks = (chirp(np.arange(start, min(start + BLOCK_SIZE, num_samples)) / sample_rate,
+                        f0=spec['start'], f1=spec['end'], t1=duration,
+                        method=spec.get('method', 'logarithmic')).astype(np.float32)
+                  for start in range(0, num_samples, BLOCK_SIZE))
+    elif kind == 'noise':
+        # Seeded from the name so the same spec always gives the same file
+        rng = np.random.default_rng(spec.get('seed', zlib.crc32(spec['name'].encode())))
+        blocks = (np.clip(rng.standard_normal(min(BLOCK_SIZE, num_samples - start),
+                                              dtype=np.float32) / 4, -1, 1)
+                  for start in range(0, num_samples, BLOCK_SIZE))
+    else:
+        raise ValueError(f"Unknown sample type: {kind}")
+
+    # Sine envelope over the whole file to avoid clicks
+    start = 0
+    for block in blocks:
+        t = np.arange(start, start + len(block)) / sample_rate
+        yield block * np.sin(np.pi * t / duration).astype(np.float32)
+        start += len(block)
 
-def create_beep(filename='beep.wav', frequency=440, duration=0.5):
+def write_sample(spec, directory='.'):
+    """Write one spec to <directory>/<name>.wav as 16-bit PCM, block by block"""
+    sample_rate = spec.get('sample_rate', 44100)
+    num_samples = int(sample_rate * spec['duration'])
+    filename = os.path.join(directory, f"{spec['name']}.wav")
+    with open(filename, 'wb') as f:
+        f.write(synth.wav_header(num_samples, sample_rate))
+        for block in signal_blocks(spec):
+            f.write(synth.to_pcm16(block).tobytes())
+    return filename
+
+def write_corpus(specs, directory, workers=None):
+    """Write every spec in parallel, returning the file names"""
+    os.makedirs(directory, exist_ok=True)
+    with ProcessPoolExecutor(workers) as executor:
+        return list(executor.map(write_sample, specs, [directory] * len(specs)))
+
+def corpus_spec(count=100, seed=0, long_minutes=3.0, long_every=25):
+    """A random but reproducible mix of tones, chords, harmonics, sweeps and noise
+
+    Every `long_every`-th file is `long_minutes` long, for load testing.
+    """
+    rng = np.random.default_rng(seed)
+    rates = [22050, 44100, 48000, 96000]
+    specs = []
+    for i in range(count):
+        kind = ['tone', 'chord', 'harmonics', 'sweep', 'noise'][i % 5]
+        duration = long_minutes * 60 if long_every and i % long_every == long_every - 1 \
+            else float(rng.choice([0.5, 1.0, 2.0, 5.0]))
+        spec = {'name': f'{i:04d}_{kind}', 'type': kind, 'duration': duration,
+                'sample_rate': int(rng.choice(rates))}
+        if kind == 'tone':
+            spec['frequencies'] = [round(float(rng.uniform(50, 5000)), 2)]
+        elif kind == 'chord':
+            spec['frequencies'] = np.round(rng.uniform(100, 2000, rng.integers(2, 6)), 2).tolist()
+        elif kind == 'harmonics':
+            spec['fundamental'] = round(float(rng.uniform(55, 880)), 2)
+            spec['harmonics'] = int(rng.integers(3, 12))
+        elif kind == 'sweep':
+            spec['start'] = round(float(rng.uniform(20, 200)), 2)
+            spec['end'] = round(float(rng.uniform(2000, 10000)), 2)
+        else:
+            spec['seed'] = int(rng.integers(2 ** 31))
+        specs.append(spec)
+    return specs
+
+def create_beep(filename='beep.wav', frequency=440, duration=0.5, sample_rate=44100):
     """Create a simple beep sound at specified frequency"""
-    sample_rate = 44100
-    t = np.linspace(0, duration, int(sample_rate * duration))
-    
-    # Simple sine wave
-    audio = np.sin(2 * np.pi * frequency * t)
-    
-    # Apply envelope to avoid clicks
-    envelope = np.sin(np.pi * t / duration)
-    audio = audio * envelope
-    
-    # Convert to 16-bit PCM
-    audio = (audio * 32767).astype(np.int16)
-    
-    wavfile.write(filename, sample_rate, audio)
+    name = os.path.splitext(filename)[0]
+    write_sample({'name': name, 'type': 'tone', 'frequencies': [frequency],
+                  'duration': duration, 'sample_rate': sample_rate})
     print(f"Created {filename} - {frequency} Hz beep")
 
-def create_chord(filename='chord.wav', frequencies=[261.63, 329.63, 392.00], duration=1.0):
+def create_chord(filename='chord.wav', frequencies=[261.63, 329.63, 392.00], duration=1.0,
+                 sample_rate=44100):
     """Create a chord with multiple frequencies (C major chord by default)"""
-    sample_rate = 44100
-    t = np.linspace(0, duration, int(sample_rate * duration))
-    
-    # Sum of sine waves
-    audio = np.zeros_like(t)
-    for freq in frequencies:
-        audio += np.sin(2 * np.pi * freq * t)
-    
-    # Normalize
-    audio = audio / len(frequencies)
-    
-    # Apply envelope
-    envelope = np.sin(np.pi * t / duration)
-    audio = audio * envelope
-    
-    # Convert to 16-bit PCM
-    audio = (audio * 32767).astype(np.int16)
-    
-    wavfile.write(filename, sample_rate, audio)
+    name = os.path.splitext(filename)[0]
+    write_sample({'name': name, 'type': 'chord', 'frequencies': list(frequencies),
+                  'duration': duration, 'sample_rate': sample_rate})
     print(f"Created {filename} - Chord with frequencies {frequencies} Hz")
 
-def create_complex_sound(filename='complex.wav', duration=0.5):
+def create_complex_sound(filename='complex.wav', duration=0.5, sample_rate=44100):
     """Create a more complex sound with multiple harmonics"""
-    sample_rate = 44100
-    t = np.linspace(0, duration, int(sample_rate * duration))
-    
-    # Fundamental frequency with harmonics
-    fundamental = 220  # A3
-    audio = np.zeros_like(t)
-    
-    # Add harmonics with decreasing amplitude
-    for i in range(1, 8):
-        amplitude = 1.0 / i
-        audio += amplitude * np.sin(2 * np.pi * fundamental * i * t)
-    
-    # Normalize
-    audio = audio / audio.max()
-    
-    # Apply envelope
-    envelope = np.sin(np.pi * t / duration)
-    audio = audio * envelope
-    
-    # Convert to 16-bit PCM
-    audio = (audio * 32767).astype(np.int16)
-    
-    wavfile.write(filename, sample_rate, audio)
+    name = os.path.splitext(filename)[0]
+    # A3 with 7 harmonics of decreasing amplitude
+    write_sample({'name': name, 'type': 'harmonics', 'fundamental': 220, 'harmonics': 7,
+                  'duration': duration, 'sample_rate': sample_rate})
     print(f"Created {filename} - Complex sound with harmonics")
 
 if __name__ == '__main__':
-    print("Generating sample audio files...\n")
-    
-    # Simple beep at A440
-    create_beep('beep.wav', 440, 0.5)
-    
-    # Higher pitched beep
-    create_beep('beep_high.wav', 880, 0.5)
-    
-    # C major chord
-    create_chord('chord.wav', [261.63, 329.63, 392.00], 1.0)
-    
-    # Complex sound with harmonics
-    create_complex_sound('complex.wav', 0.5)
-    
-    print("\nAll sample files created successfully!")
-    print("You can now upload these files to the FFT analyzer.")
+    parser = argparse.ArgumentParser(description='Generate sample audio files')
+    parser.add_argument('--corpus', help='write a corpus of files into this directory')
+    parser.add_argument('--spec', help='JSON file with a list of specs (default: random corpus)')
+    parser.add_argument('--count', type=int, default=100, help='files in a random corpus')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--long-minutes', type=float, default=3.0,
+                        help='length of the occasional long file in a random corpus')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.corpus:
+        if args.spec:
+            with open(args.spec) as f:
+                specs = json.load(f)
+        else:
+            specs = corpus_spec(args.count, args.seed, args.long_minutes)
+        files = write_corpus(specs, args.corpus, args.workers)
+        with open(os.path.join(args.corpus, 'corpus.json'), 'w') as f:
+            json.dump(specs, f, indent=2)
+        print(f"Created {len(files)} files in {args.corpus} (specs in corpus.json)")
+    else:
+        print("Generating sample audio files...\n")
+
+        # Simple beep at A440
+        create_beep('beep.wav', 440, 0.5)
+
+        # Higher pitched beep
+        create_beep('beep_high.wav', 880, 0.5)
+
+        # C major chord
+        create_chord('chord.wav', [261.63, 329.63, 392.00], 1.0)
+
+        # Complex sound with harmonics
+        create_complex_sound('complex.wav', 0.5)
+
+        print("\nAll sample files created successfully!")
+        print("You can now upload these files to the FFT analyzer.")
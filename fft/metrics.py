@@ -0,0 +1,197 @@
+"""
+Lightweight timing metrics, exported in Prometheus text format
+
+    with metrics.timer('decode'):
+        ...
+
+Every timer adds to a histogram of that stage's durations and, inside a
+request, to the request's own list of spans, which is sent back in a
+Server-Timing header. init_app() times whole requests and adds /metrics.
+
+Metrics are on unless disabled (e.g. FFT_METRICS=0); when disabled
+timer() hands back a shared no-op context manager and nothing is recorded.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+
+from flask import Response, g, has_request_context, request
+
+# Upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HELP = {
+    'stage_seconds': 'Time spent in each processing stage',
+    'request_seconds': 'Time spent handling each request, by endpoint and status',
+}
+
+enabled = True
+prefix = 'app'
+
+_NULL = nullcontext()
+_lock = threading.Lock()
+_histograms = {}  # (name, labels) -> Histogram
+_counters = {}  # (name, labels) -> value
+_collected = {}  # name -> (kind, function returning the current value(s))
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class _Timer:
+    __slots__ = ('stage', 'labels', 'start')
+
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        observe('stage_seconds', elapsed, stage=self.stage, **self.labels)
+        if has_request_context():
+            g.setdefault('spans', []).append((self.stage, elapsed))
+        return False
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def timer(stage, **labels):
+    """Context manager timing one stage of the work, with optional extra labels"""
+    if not enabled:
+        return _NULL
+    return _Timer(stage, labels)
+
+
+def observe(name, value, **labels):
+    """Add a value (usually seconds) to the histogram `name`"""
+    if not enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(value)
+
+
+def inc(name, amount=1, **labels):
+    """Add to the counter `name`"""
+    if not enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def collect(name, func, kind='gauge', help=None):
+    """Report func() under `name` on every scrape, for values kept elsewhere
+
+    func returns a number, or a dict mapping labels (tuples of (label,
+    value) pairs) to numbers. `kind` is 'gauge' or 'counter'.
+    """
+    _collected[name] = (kind, func)
+    if help:
+        HELP[name] = help
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _header(lines, name, kind):
+    full = f'{prefix}_{name}'
+    lines.append(f'# HELP {full} {HELP.get(name, name)}')
+    lines.append(f'# TYPE {full} {kind}')
+    return full
+
+
+def render():
+    """Every metric in Prometheus text exposition format"""
+    with _lock:
+        histograms = {key: (list(h.counts), h.sum, h.buckets) for key, h in _histograms.items()}
+        counters = dict(_counters)
+
+    lines = []
+    seen = set()
+    for (name, labels), (counts, total, buckets) in sorted(histograms.items()):
+        full = f'{prefix}_{name}'
+        if name not in seen:
+            seen.add(name)
+            _header(lines, name, 'histogram')
+        cumulative = 0
+        for bound, count in zip(buckets + ('+Inf',), counts):
+            cumulative += count
+            lines.append(f'{full}_bucket{_labels(labels + (("le", bound),))} {cumulative}')
+        lines.append(f'{full}_sum{_labels(labels)} {total}')
+        lines.append(f'{full}_count{_labels(labels)} {cumulative}')
+
+    for (name, labels), value in sorted(counters.items()):
+        if name not in seen:
+            seen.add(name)
+            _header(lines, name, 'counter')
+        lines.append(f'{prefix}_{name}{_labels(labels)} {value}')
+
+    for name, (kind, func) in sorted(_collected.items()):
+        full = _header(lines, name, kind)
+        values = func()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in sorted(values.items()):
+            lines.append(f'{full}{_labels(labels)} {value}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def init_app(app, name, on=True):
+    """Time every request of `app` and serve the metrics at /metrics
+
+    Metric names start with `name`. With on=False nothing is recorded and
+    /metrics isn't added.
+    """
+    global enabled, prefix
+    enabled = on
+    prefix = name
+    if not on:
+        return
+
+    @app.before_request
+    def start_request():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def finish_request(response):
+        start = g.pop('request_start', None)
+        if start is not None:
+            elapsed = time.perf_counter() - start
+            observe('request_seconds', elapsed, endpoint=request.endpoint or 'none',
+                    method=request.method, status=response.status_code)
+            spans = g.get('spans', [])
+            response.headers['Server-Timing'] = ', '.join(
+                [f'{stage};dur={seconds * 1000:.1f}' for stage, seconds in spans] +
+                [f'total;dur={elapsed * 1000:.1f}'])
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(render(), mimetype='text/plain; version=0.0.4')
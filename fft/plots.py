@@ -0,0 +1,136 @@
+"""
+Fast rendering of sine wave component plots for the FFT analyzer
+"""
+import queue
+import threading
+import base64
+import tempfile
+from contextlib import contextmanager
+from io import BytesIO
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
+
+# 50ms of signal, same as the original per-component plots
+PLOT_TIME = np.linspace(0, 0.05, 1000)
+
+# PDF reports up to this size are built in memory, bigger ones in a temp file
+SPOOL_SIZE = 16 * 1024 * 1024
+
+
+def sine_waves(frequencies, magnitudes, phases, t=PLOT_TIME):
+    """Compute every component's waveform in one broadcast -> (n_components, len(t))"""
+    frequencies = np.asarray(frequencies, dtype=float)[:, None]
+    magnitudes = np.asarray(magnitudes, dtype=float)[:, None]
+    phases = np.asarray(phases, dtype=float)[:, None]
+    return magnitudes * np.sin(2 * np.pi * frequencies * t + phases)
+
+
+class ComponentRenderer:
+    """Draws component plots by reusing one figure and one line.
+
+    Building a matplotlib figure is far more expensive than drawing it, so the
+    figure, axes and Line2D are created once and only the data, title and
+    limits change between plots.
+    """
+
+    def __init__(self, t=PLOT_TIME):
+        self.t = t
+        self.fig = Figure(figsize=(10, 3), dpi=80)
+        FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot()
+        (self.line,) = self.ax.plot(t, np.zeros_like(t), 'b-', linewidth=2)
+        self.ax.set_xlabel('Time (s)')
+        self.ax.set_ylabel('Amplitude')
+        self.ax.set_xlim(t[0], t[-1])
+        self.ax.grid(True, alpha=0.3)
+        self.title = self.ax.set_title('')
+        self.fig.tight_layout()
+
+    def render_png(self, wave, frequency):
+        """Render a single waveform to PNG bytes"""
+        self.line.set_ydata(wave)
+        peak = float(np.abs(wave).max()) or 1.0
+        self.ax.set_ylim(-peak * 1.1, peak * 1.1)
+        self.title.set_text(f'Frequency: {frequency:.2f} Hz')
+
+        buf = BytesIO()
+        self.fig.savefig(buf, format='png')
+        return buf.getvalue()
+
+    def render_all(self, frequencies, magnitudes, phases):
+        """Render every component, returning a list of base64 PNG strings"""
+        waves = sine_waves(frequencies, magnitudes, phases, self.t)
+        return [base64.b64encode(self.render_png(wave, freq)).decode('utf-8')
+                for wave, freq in zip(waves, frequencies)]
+
+
+# Figures aren't safe to share between threads, and the dev server starts a
+# new thread for every request, so renderers are lent out from a small pool
+POOL_SIZE = 4
+_pool = queue.LifoQueue()
+_pool_lock = threading.Lock()
+_pool_created = 0
+
+
+@contextmanager
+def renderer():
+    """Borrow a ComponentRenderer, waiting if all POOL_SIZE of them are in use"""
+    global _pool_created
+    with _pool_lock:
+        if _pool.empty() and _pool_created < POOL_SIZE:
+            _pool.put(ComponentRenderer())
+            _pool_created += 1
+    borrowed = _pool.get()
+    try:
+        yield borrowed
+    finally:
+        _pool.put(borrowed)
+
+
+def pdf_report(results, sample_rate, generated_at, spool_size=SPOOL_SIZE):
+    """Build the results PDF, returning it as a file object positioned at the start
+
+    Pages are vector plots drawn by reusing one figure and one line, as in
+    ComponentRenderer. matplotlib only finishes a PDF (its fonts and cross
+    references) when it is closed, so the report is built in a
+    SpooledTemporaryFile: in memory up to `spool_size` bytes, on disk after.
+    """
+    out = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    with PdfPages(out) as pdf:
+        # Title page
+        fig = Figure(figsize=(11, 8.5))
+        fig.text(0.5, 0.7, 'Audio FFT Analysis Results',
+                 ha='center', fontsize=24, fontweight='bold')
+        fig.text(0.5, 0.6, f'Sample Rate: {sample_rate} Hz', ha='center', fontsize=14)
+        fig.text(0.5, 0.5, f'Top {len(results)} Sine Wave Components', ha='center', fontsize=14)
+        fig.text(0.5, 0.4, f'Generated: {generated_at.strftime("%Y-%m-%d %H:%M:%S")}',
+                 ha='center', fontsize=12, style='italic')
+        pdf.savefig(fig)
+
+        # One page per component, only swapping the data and text
+        fig = Figure(figsize=(11, 8.5))
+        ax = fig.add_axes([0.1, 0.3, 0.8, 0.5])
+        (line,) = ax.plot(PLOT_TIME, np.zeros_like(PLOT_TIME), 'b-', linewidth=2)
+        ax.set_xlabel('Time (s)', fontsize=12)
+        ax.set_ylabel('Amplitude', fontsize=12)
+        ax.set_xlim(PLOT_TIME[0], PLOT_TIME[-1])
+        ax.grid(True, alpha=0.3)
+        title = fig.text(0.5, 0.85, '', ha='center', fontsize=16, fontweight='bold')
+        equation = fig.text(0.5, 0.2, '', ha='center', fontsize=11,
+                            bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
+
+        waves = sine_waves([r['frequency'] for r in results], [r['magnitude'] for r in results],
+                           [r['phase'] for r in results])
+        for idx, (result, wave) in enumerate(zip(results, waves)):
+            line.set_ydata(wave)
+            peak = float(np.abs(wave).max()) or 1.0
+            ax.set_ylim(-peak * 1.1, peak * 1.1)
+            title.set_text(f'Component #{idx + 1} - Frequency: {result["frequency"]:.2f} Hz')
+            equation.set_text(result['equation'])
+            pdf.savefig(fig)
+
+    out.seek(0)
+    return out
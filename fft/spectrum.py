@@ -0,0 +1,253 @@
+"""
+Streaming spectrum helpers for the FFT analyzer
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.io import wavfile
+from scipy.fft import rfft, rfftfreq, next_fast_len
+from scipy.signal import get_window
+
+
+def to_mono_float(block):
+    """Convert a (possibly stereo) block of samples to a mono float32 array"""
+    block = np.asarray(block)
+    if block.ndim > 1:
+        return block.mean(axis=1, dtype=np.float32)
+    return block.astype(np.float32)
+
+
+def _read_wav(file_path):
+    try:
+        return wavfile.read(file_path, mmap=True)
+    except ValueError:
+        # Some formats (e.g. 24-bit PCM) can't be memory-mapped
+        return wavfile.read(file_path)
+
+
+def read_mono(file_path):
+    """Read a whole WAV file as one mono float32 array -> (sample_rate, samples)"""
+    sample_rate, data = _read_wav(file_path)
+    return sample_rate, to_mono_float(data)
+
+
+def read_wav_blocks(file_path, block_size=8192):
+    """Read a WAV file block by block, yielding mono float32 arrays.
+
+    The file is memory-mapped so only one block at a time is converted to
+    floats. Returns (sample_rate, generator of blocks).
+    """
+    sample_rate, data = _read_wav(file_path)
+
+    def blocks():
+        for start in range(0, len(data), block_size):
+            yield to_mono_float(data[start:start + block_size])
+
+    return sample_rate, blocks()
+
+
+def real_spectrum(samples, sample_rate, fast_len=False, window=None):
+    """FFT of a real mono signal -> (frequencies, magnitudes, phases), DC excluded
+
+    Uses the real-input FFT so only the positive half of the spectrum is ever
+    computed. With `fast_len` the signal is zero-padded to the next length
+    the FFT handles quickly, which matters for awkward (e.g. prime) lengths.
+    If a `window` (e.g. 'hann') is given it is applied first. Magnitudes are
+    scaled to sine amplitudes either way, the same unit WelchAccumulator
+    uses, so results don't depend on the file's length or analysis mode.
+    Phases are for sines, sin(2π f t + phase), as the mixer and plots use.
+    """
+    n = len(samples)
+    n_fft = next_fast_len(n, real=True) if fast_len else n
+    if window is not None:
+        w = get_window(window, n).astype(np.float32)
+        yf = rfft(samples * w, n=n_fft)[1:]
+        magnitudes = 2 * np.abs(yf) / w.sum()
+    else:
+        yf = rfft(samples, n=n_fft)[1:]
+        magnitudes = 2 * np.abs(yf) / max(n, 1)
+    xf = rfftfreq(n_fft, 1 / sample_rate)[1:]
+    # The FFT measures phase against a cosine; a sine lags it by π/2
+    return xf, magnitudes, np.angle(1j * yf)
+
+
+def top_k_indices(magnitudes, k):
+    """Indices of the k largest magnitudes, largest first, without a full sort"""
+    k = min(k, len(magnitudes))
+    if k <= 0:
+        return np.empty(0, dtype=int)
+    top = np.argpartition(magnitudes, -k)[-k:]
+    return top[np.argsort(magnitudes[top])[::-1]]
+
+
+def find_peaks(magnitudes, k):
+    """Indices of the k largest local maxima, largest first
+
+    Neighbouring bins smeared by leakage are never local maxima themselves,
+    so each index is a distinct spectral peak.
+    """
+    m = magnitudes
+    is_peak = (m[1:-1] > m[:-2]) & (m[1:-1] >= m[2:])
+    candidates = np.flatnonzero(is_peak) + 1
+    return candidates[top_k_indices(m[candidates], k)]
+
+
+def interpolate_peaks(magnitudes, indices):
+    """Fit a parabola through each peak and its neighbours on a log scale
+
+    Returns (offset in bins from each index, interpolated peak magnitude).
+    """
+    log_m = np.log(np.asarray(magnitudes, dtype=float) + 1e-12)
+    a, b, c = log_m[indices - 1], log_m[indices], log_m[indices + 1]
+    denom = a - 2 * b + c
+    offset = np.where(denom != 0, 0.5 * (a - c) / np.where(denom != 0, denom, 1), 0.0)
+    peak = np.exp(b - 0.25 * (a - c) * offset)
+    return offset, peak
+
+
+def phase_turn(df, first, hop=0.0, count=1):
+    """How far a tone `df` Hz off its bin turns that bin's phase
+
+    The spectrum is the sum of `count` Hann-windowed segments centred at
+    `first`, `first + hop`, ... seconds (one segment for a plain FFT). In
+    each segment the tone has turned by 2π * df * (its centre) relative to
+    the bin; the result is the angle of the sum, which for many segments
+    can point backwards.
+    """
+    df = np.asarray(df, dtype=float)
+    turn = 2 * np.pi * df * (first + (count - 1) * hop / 2)
+    if count > 1:
+        half = np.pi * df * hop
+        safe = np.where(np.sin(half) != 0, np.sin(half), 1)
+        ratio = np.where(np.sin(half) != 0, np.sin(count * half) / safe, count)
+        turn = turn + np.pi * (ratio < 0)
+    return turn
+
+
+def pick_peaks(xf, magnitudes, phases, k=30, segments=(0.0, 0.0, 1), offsets=None):
+    """The k strongest distinct peaks with sub-bin frequency, magnitude and phase
+
+    Returns (frequencies, magnitudes, phases). A bin's phase is only exact
+    for a tone right on the bin, so the turn a tone between bins adds (see
+    phase_turn, which takes `segments` as (first, hop, count)) is taken off.
+    That needs a precise frequency: averaged spectra can pass measured
+    per-bin `offsets` (WelchAccumulator.offsets) instead of the parabolic fit.
+    """
+    peaks = find_peaks(magnitudes, k)
+    offset, peak_magnitudes = interpolate_peaks(magnitudes, peaks)
+    if offsets is not None:
+        offset = offsets[peaks]
+    bin_width = xf[1] - xf[0] if len(xf) > 1 else 0.0
+    turn = phase_turn(offset * bin_width, *segments)
+    peak_phases = np.angle(np.exp(1j * (phases[peaks] - turn)))
+    return xf[peaks] + offset * bin_width, peak_magnitudes, peak_phases
+
+
+def spectrogram(samples, sample_rate, n_fft=1024, hop=256, window='hann', chunk_frames=512):
+    """Short-time FFT -> (frame times, frequencies, magnitudes of shape [frames, bins])
+
+    Frames are strided views into `samples`, so framing copies nothing; the
+    FFT runs over `chunk_frames` frames at a time to keep temporaries small.
+    """
+    if len(samples) < n_fft:
+        samples = np.pad(samples, (0, n_fft - len(samples)))
+    frames = sliding_window_view(samples, n_fft)[::hop]
+    w = get_window(window, n_fft).astype(np.float32)
+
+    magnitudes = np.empty((len(frames), n_fft // 2 + 1), dtype=np.float32)
+    for start in range(0, len(frames), chunk_frames):
+        chunk = frames[start:start + chunk_frames]
+        magnitudes[start:start + len(chunk)] = np.abs(rfft(chunk * w, axis=1))
+
+    times = (np.arange(len(frames)) * hop + n_fft / 2) / sample_rate
+    freqs = rfftfreq(n_fft, 1 / sample_rate)
+    return times, freqs, magnitudes
+
+
+def quantize_db(magnitudes, db_range=80):
+    """Convert magnitudes to uint8 decibels: 255 is the loudest, 0 is db_range below it
+
+    Works in place on `magnitudes`.
+    """
+    db = np.log10(magnitudes + 1e-10, out=magnitudes)
+    db *= 20
+    db -= db.max() - db_range
+    db *= 255 / db_range
+    return np.clip(db, 0, 255, out=db).astype(np.uint8)
+
+
+class WelchAccumulator:
+    """Builds a Welch-style averaged spectrum from blocks of samples.
+
+    Blocks can be any length; they are cut into Hann-windowed segments of
+    `nperseg` samples with 50% overlap. Only one segment worth of samples is
+    kept between calls to `feed`, so memory does not grow with the file.
+    """
+
+    def __init__(self, sample_rate, nperseg=8192):
+        self.sample_rate = sample_rate
+        self.nperseg = nperseg
+        self.hop = nperseg // 2
+        self.window = get_window('hann', nperseg).astype(np.float32)
+        self.freqs = rfftfreq(nperseg, 1 / sample_rate)
+
+        self.power = np.zeros(len(self.freqs))
+        self.coherent = np.zeros(len(self.freqs), dtype=complex)
+        # Sum of each segment times the previous one's conjugate: its angle is
+        # how far each bin's phase moves per hop, i.e. the exact frequency
+        self.lagged = np.zeros(len(self.freqs), dtype=complex)
+        self._previous = None
+        self.count = 0
+        self._first_start = None  # sample index of the first segment
+
+        self._buffer = np.empty(0, dtype=np.float32)
+        self._offset = 0  # sample index of the first sample in _buffer
+
+    def _add_segment(self, segment, start):
+        spectrum = rfft(segment * self.window)
+        self.power += np.abs(spectrum) ** 2
+        # Shift the phase back to t = 0 so segments add up coherently
+        spectrum = spectrum * np.exp(-2j * np.pi * self.freqs * start / self.sample_rate)
+        self.coherent += spectrum
+        if self._previous is not None:
+            self.lagged += spectrum * np.conj(self._previous)
+        self._previous = spectrum
+        self.count += 1
+        if self._first_start is None:
+            self._first_start = start
+
+    def feed(self, block):
+        buf = np.concatenate([self._buffer, block])
+        start = 0
+        while start + self.nperseg <= len(buf):
+            self._add_segment(buf[start:start + self.nperseg], self._offset + start)
+            start += self.hop
+        self._buffer = buf[start:]
+        self._offset += start
+
+    def offsets(self):
+        """Each positive bin's frequency offset in bins, measured from the phase
+        steps between segments (see pick_peaks), or None with a single segment"""
+        if self.count < 2:
+            return None
+        offsets = np.angle(self.lagged) / (2 * np.pi * self.hop / self.nperseg)
+        return offsets[self.freqs > 0]
+
+    def segments(self):
+        """(centre of the first segment, hop, number of segments), in seconds, for pick_peaks"""
+        first = self.nperseg / 2 if self._first_start is None else self._first_start + self.nperseg / 2
+        return first / self.sample_rate, self.hop / self.sample_rate, max(self.count, 1)
+
+    def finish(self):
+        """Return (frequencies, amplitudes, sine phases) for positive frequencies"""
+        if self.count == 0:
+            # Shorter than one segment: zero-pad what we have
+            segment = np.zeros(self.nperseg, dtype=np.float32)
+            segment[:len(self._buffer)] = self._buffer
+            self._add_segment(segment, self._offset)
+
+        # Scale to sine amplitude units so magnitudes don't depend on file length
+        magnitudes = 2 * np.sqrt(self.power / self.count) / self.window.sum()
+        phases = np.angle(1j * self.coherent)
+
+        positive = self.freqs > 0
+        return self.freqs[positive], magnitudes[positive], phases[positive]
@@ -0,0 +1,74 @@
+"""
+Result stores for the FFT analyzer
+
+Analyses are saved under a token so that /plot, /save-results and /mix-audio
+can find them again. The in-memory store is the default; the SQLite store can
+be shared by several gunicorn workers on the same machine.
+"""
+import json
+import sqlite3
+import threading
+import time
+
+from cache import LRUCache
+
+
+class MemoryResultStore:
+    """Keeps results in this process, evicting old and least recently used ones"""
+
+    def __init__(self, maxsize=64, ttl=3600):
+        self._cache = LRUCache(maxsize, ttl=ttl)
+
+    def get(self, token):
+        return self._cache.get(token)
+
+    def set(self, token, value):
+        self._cache.set(token, value)
+
+
+class SQLiteResultStore:
+    """Keeps results as JSON in a SQLite file shared between worker processes"""
+
+    def __init__(self, path, maxsize=1000, ttl=3600):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS results ('
+                         'token TEXT PRIMARY KEY, value TEXT NOT NULL, used REAL NOT NULL)')
+
+    def _connect(self):
+        # sqlite connections can't be shared between threads
+        if not hasattr(self._local, 'conn'):
+            self._local.conn = sqlite3.connect(self.path, timeout=10)
+        return self._local.conn
+
+    def get(self, token):
+        conn = self._connect()
+        with conn:
+            row = conn.execute('SELECT value FROM results WHERE token = ? AND used > ?',
+                               (token, time.time() - self.ttl)).fetchone()
+            if row is None:
+                return None
+            conn.execute('UPDATE results SET used = ? WHERE token = ?', (time.time(), token))
+        return json.loads(row[0])
+
+    def set(self, token, value):
+        conn = self._connect()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO results (token, value, used) VALUES (?, ?, ?)',
+                         (token, json.dumps(value), time.time()))
+            # Drop expired rows and anything past the size limit
+            conn.execute('DELETE FROM results WHERE used < ?', (time.time() - self.ttl,))
+            conn.execute('DELETE FROM results WHERE token NOT IN '
+                         '(SELECT token FROM results ORDER BY used DESC LIMIT ?)', (self.maxsize,))
+
+
+def make_store(url, maxsize, ttl):
+    """Create a store from a URL: 'memory' or 'sqlite:///path/to/results.db'"""
+    if url == 'memory':
+        return MemoryResultStore(maxsize, ttl)
+    if url.startswith('sqlite:///'):
+        return SQLiteResultStore(url[len('sqlite:///'):], maxsize, ttl)
+    raise ValueError(f'Unknown result store: {url}')
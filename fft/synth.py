@@ -0,0 +1,213 @@
+"""
+Sine wave synthesis for the FFT analyzer's audio mixer
+"""
+import io
+import struct
+from io import BytesIO
+
+import numpy as np
+
+
+class OscillatorBank:
+    """Generates the sum of many sine waves block by block.
+
+    Each block is one complex matrix-vector product: the per-sample phasor
+    table is built once, and only every oscillator's starting phasor changes
+    from block to block. Phases are tracked in float64 so long outputs don't
+    drift, while the samples themselves are float32.
+    """
+
+    def __init__(self, frequencies, magnitudes, phases, sample_rate, block_size=4096):
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.omega = 2 * np.pi * np.asarray(frequencies, dtype=float) / sample_rate
+        self.magnitudes = np.asarray(magnitudes, dtype=float)
+        self.phases = np.asarray(phases, dtype=float)
+        # table[k, n] = e^(i * omega_k * n) for one block
+        self._table = np.exp(1j * np.outer(self.omega, np.arange(block_size))).astype(np.complex64)
+
+    def peak_bound(self):
+        """The output can never exceed the sum of the magnitudes"""
+        return float(np.abs(self.magnitudes).sum())
+
+    def blocks(self, num_samples):
+        """Yield float32 blocks of the summed signal, num_samples in total"""
+        for start in range(0, num_samples, self.block_size):
+            phase = np.mod(self.phases + self.omega * start, 2 * np.pi)
+            state = (self.magnitudes * np.exp(1j * phase)).astype(np.complex64)
+            block = (state @ self._table).imag
+            yield block[:num_samples - start]
+
+    def render(self, num_samples):
+        """The whole signal as one float32 array"""
+        out = np.empty(num_samples, dtype=np.float32)
+        for start, block in zip(range(0, num_samples, self.block_size), self.blocks(num_samples)):
+            out[start:start + len(block)] = block
+        return out
+
+
+def apply_fades(audio, sample_rate, fade_time=0.01):
+    """Fade in and out (10ms by default) to avoid clicks, in place"""
+    fade_samples = min(int(fade_time * sample_rate), len(audio) // 2)
+    if fade_samples > 0:
+        ramp = np.linspace(0, 1, fade_samples, dtype=np.float32)
+        audio[:fade_samples] *= ramp
+        audio[-fade_samples:] *= ramp[::-1]
+    return audio
+
+
+def to_pcm16(audio):
+    """Convert float samples in [-1, 1] to 16-bit PCM"""
+    return (np.clip(audio, -1, 1) * 32767).astype('<i2')
+
+
+def wav_header(num_samples, sample_rate, channels=1, bits=16):
+    """44-byte header for a PCM WAV file holding num_samples frames"""
+    block_align = channels * bits // 8
+    data_size = num_samples * block_align
+    return (b'RIFF' + struct.pack('<I', 36 + data_size) + b'WAVE' +
+            b'fmt ' + struct.pack('<IHHIIHH', 16, 1, channels, sample_rate,
+                                  sample_rate * block_align, block_align, bits) +
+            b'data' + struct.pack('<I', data_size))
+
+
+def mix_to_wav(frequencies, magnitudes, phases, sample_rate, duration=2.0, level=0.8):
+    """Mix sine waves into an in-memory 16-bit WAV file, normalized to `level`"""
+    num_samples = int(sample_rate * duration)
+    bank = OscillatorBank(frequencies, magnitudes, phases, sample_rate)
+    audio = bank.render(num_samples)
+
+    # Normalize to prevent clipping
+    peak = np.abs(audio).max() if num_samples else 0
+    if peak > 0:
+        audio *= level / peak
+    apply_fades(audio, sample_rate)
+
+    buf = BytesIO()
+    buf.write(wav_header(num_samples, sample_rate))
+    buf.write(to_pcm16(audio).tobytes())
+    return buf.getvalue()
+
+
+def stream_blocks(bank, num_samples, level=0.8, fade_time=0.01):
+    """Yield normalized, faded float32 blocks without holding the whole signal
+
+    The true peak isn't known until the end, so the output is scaled by the
+    sum of the magnitudes, which can never clip.
+    """
+    bound = bank.peak_bound()
+    scale = level / bound if bound > 0 else 0.0
+    fade_samples = max(1, min(int(fade_time * bank.sample_rate), num_samples // 2))
+    start = 0
+    for block in bank.blocks(num_samples):
+        block = block * scale
+        if start < fade_samples or start + len(block) > num_samples - fade_samples:
+            idx = np.arange(start, start + len(block))
+            block *= np.minimum(1, np.minimum(idx, num_samples - 1 - idx) / fade_samples)
+        start += len(block)
+        yield block
+
+
+def stream_wav(bank, num_samples, level=0.8):
+    """Yield a 16-bit WAV file piece by piece: the header, then PCM blocks"""
+    yield wav_header(num_samples, bank.sample_rate)
+    for block in stream_blocks(bank, num_samples, level):
+        yield to_pcm16(block).tobytes()
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Seekable file object that only keeps bytes not yet sent to the client
+
+    Encoders sometimes seek back to patch headers when they finish; writes
+    to data that has already been sent are dropped.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._pending = bytearray()
+        self._sent = 0
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def read(self, size=-1):
+        return b''
+
+    def write(self, data):
+        offset = self._pos - self._sent
+        if offset >= 0:
+            end = offset + len(data)
+            if end > len(self._pending):
+                self._pending.extend(bytes(end - len(self._pending)))
+            self._pending[offset:end] = data
+        self._pos += len(data)
+        return len(data)
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            pos += self._pos
+        elif whence == io.SEEK_END:
+            pos += self._sent + len(self._pending)
+        self._pos = pos
+        return pos
+
+    def tell(self):
+        return self._pos
+
+    def pending(self):
+        return len(self._pending)
+
+    def drain(self):
+        data = bytes(self._pending)
+        self._sent += len(data)
+        self._pending.clear()
+        return data
+
+
+def _flac_set_length(header, num_samples):
+    """Fill in the total sample count in a FLAC file's STREAMINFO block
+
+    STREAMINFO always comes right after the 'fLaC' marker; the count is the
+    low 36 bits of the big-endian 64-bit field at bytes 18-25.
+    """
+    header = bytearray(header)
+    field = struct.unpack('>Q', header[18:26])[0]
+    field = (field & ~((1 << 36) - 1)) | num_samples
+    header[18:26] = struct.pack('>Q', field)
+    return bytes(header)
+
+
+def stream_encoded(bank, num_samples, file_format, level=0.8):
+    """Yield an OGG (Vorbis) or FLAC file piece by piece (needs the soundfile package)
+
+    The encoder only writes the FLAC length once it finishes, after the
+    header has been sent, so it is filled in here from `num_samples` instead;
+    without it libsndfile can't read the file back. The MD5 and frame size
+    fields stay 0, which the format allows to mean unknown.
+    """
+    import soundfile
+
+    subtype = 'VORBIS' if file_format == 'OGG' else 'PCM_16'
+    out = _StreamBuffer()
+    header = file_format == 'FLAC'  # still to be patched
+    with soundfile.SoundFile(out, 'w', samplerate=bank.sample_rate, channels=1,
+                             format=file_format, subtype=subtype) as f:
+        for block in stream_blocks(bank, num_samples, level):
+            f.write(block)
+            if header and out.pending() < 26:
+                continue
+            data = out.drain()
+            if header:
+                data = _flac_set_length(data, num_samples)
+                header = False
+            if data:
+                yield data
+    data = out.drain()
+    yield _flac_set_length(data, num_samples) if header else data
@@ -0,0 +1,51 @@
+"""
+Tests for analyze_audio's components, in full and streaming mode
+
+Run with: python -m pytest -q test_analysis.py
+"""
+import numpy as np
+import pytest
+from scipy.io import wavfile
+
+import analysis
+import synth
+
+SAMPLE_RATE = 44100
+# (frequency, amplitude, phase); neither frequency falls on an FFT bin
+TONES = [(441.37, 0.4, 2.5), (1234.56, 0.2, -1.2)]
+
+
+def tones(duration):
+    t = np.arange(int(SAMPLE_RATE * duration)) / SAMPLE_RATE
+    return sum(a * np.sin(2 * np.pi * f * t + p) for f, a, p in TONES) * 32767
+
+
+def write_tones(tmp_path, duration):
+    path = tmp_path / 'tones.wav'
+    wavfile.write(path, SAMPLE_RATE, tones(duration).astype(np.int16))
+    return str(path)
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+@pytest.mark.parametrize('duration', [2.3, 20])
+def test_phases_between_bins(tmp_path, duration, streaming):
+    path = write_tones(tmp_path, duration)
+    results, _ = analysis.analyze_audio(path, streaming=streaming, render_plots=False,
+                                        num_components=len(TONES))
+    for result, (frequency, amplitude, phase) in zip(results, TONES):
+        assert result['frequency'] == pytest.approx(frequency, abs=0.05)
+        assert result['magnitude'] == pytest.approx(amplitude * 32767, rel=0.05)
+        assert np.angle(np.exp(1j * (result['phase'] - phase))) == pytest.approx(0, abs=0.1)
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_mixer_reproduces_the_input(tmp_path, streaming):
+    path = write_tones(tmp_path, 2.3)
+    results, _ = analysis.analyze_audio(path, streaming=streaming, render_plots=False,
+                                        num_components=len(TONES))
+    bank = synth.OscillatorBank([r['frequency'] for r in results], [r['magnitude'] for r in results],
+                                [r['phase'] for r in results], SAMPLE_RATE)
+    mixed = bank.render(int(SAMPLE_RATE * 2.3))
+    original = tones(2.3)
+    assert np.corrcoef(mixed, original)[0, 1] > 0.99
+    assert np.sqrt(np.mean((mixed - original) ** 2)) < 0.05 * np.sqrt(np.mean(original ** 2))
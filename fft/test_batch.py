@@ -0,0 +1,56 @@
+"""
+Tests for batch analysis when a worker process crashes
+
+Run with: python -m pytest -q test_batch.py
+"""
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pytest
+from scipy.io import wavfile
+
+import app as fft_app
+import batch
+
+SAMPLE_RATE = 8000
+
+
+def tone(path):
+    t = np.arange(SAMPLE_RATE) / SAMPLE_RATE
+    wavfile.write(path, SAMPLE_RATE, (np.sin(2 * np.pi * 440 * t) * 10000).astype(np.int16))
+    return str(path)
+
+
+def broken_pool():
+    pool = ProcessPoolExecutor(1)
+    with pytest.raises(BrokenProcessPool):
+        pool.submit(os._exit, 1).result()
+    return pool
+
+
+def test_broken_pool_reports_every_file(tmp_path):
+    paths = [tone(tmp_path / f'{i}.wav') for i in range(3)]
+    seen = []
+    records = list(batch.run_batch(broken_pool(), paths, {'render_plots': False}, on_broken=seen.append))
+    assert [r['file'] for r in records] == paths
+    assert all('crashed' in r['error'] for r in records)
+    assert len(seen) == 1
+
+
+def test_analyze_batch_replaces_a_broken_pool(tmp_path):
+    client = fft_app.app.test_client()
+    fft_app.batch_pool = broken_pool()
+
+    def post():
+        with open(tone(tmp_path / 'a.wav'), 'rb') as f:
+            response = client.post('/analyze-batch', data={'audio_files': (f, 'a.wav')})
+        return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    assert 'crashed' in post()[0]['error']
+    assert fft_app.batch_pool is None
+    records = post()
+    assert records[0]['file'] == 'a.wav' and 'error' not in records[0]
+    fft_app.batch_pool.shutdown()
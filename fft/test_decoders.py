@@ -0,0 +1,34 @@
+"""
+Tests for decoders.decode_blocks' fallback from soundfile to PyAV
+
+Run with: python -m pytest -q test_decoders.py
+"""
+import struct
+
+import numpy as np
+import pytest
+
+import decoders
+import synth
+
+SAMPLE_RATE = 44100
+NUM_SAMPLES = SAMPLE_RATE
+
+
+def test_falls_back_to_av_when_soundfile_cant_read(tmp_path):
+    pytest.importorskip('soundfile')
+    pytest.importorskip('av')
+    bank = synth.OscillatorBank([440], [1.0], [0.0], SAMPLE_RATE)
+    data = bytearray(b''.join(synth.stream_encoded(bank, NUM_SAMPLES, 'FLAC')))
+    # Mark the length as unknown: libsndfile opens such a file but fails to read it
+    field = struct.unpack('>Q', data[18:26])[0]
+    data[18:26] = struct.pack('>Q', field & ~((1 << 36) - 1))
+    path = tmp_path / 'unknown_length.flac'
+    path.write_bytes(bytes(data))
+
+    sample_rate, blocks = decoders.decode_blocks(str(path))
+    samples = np.concatenate(list(blocks))
+    assert sample_rate == SAMPLE_RATE
+    # The samples ffmpeg supplies after soundfile failed line up with those before
+    expected = np.concatenate(list(synth.stream_blocks(bank, NUM_SAMPLES))) * decoders.PCM16_SCALE
+    np.testing.assert_allclose(samples, expected, atol=2)
@@ -0,0 +1,24 @@
+"""
+Tests for the shared pool of plot renderers
+
+Run with: python -m pytest -q test_plots.py
+"""
+import threading
+
+import plots
+
+
+def test_threads_share_a_few_renderers():
+    seen = set()
+
+    def draw():
+        with plots.renderer() as renderer:
+            seen.add(id(renderer))
+            renderer.render_png(plots.sine_waves([440], [1], [0])[0], 440)
+
+    threads = [threading.Thread(target=draw) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert 1 <= len(seen) <= plots.POOL_SIZE
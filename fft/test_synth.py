@@ -0,0 +1,53 @@
+"""
+Round-trip tests for the streamed mixer output: encode, then decode it again
+
+Run with: python -m pytest -q test_synth.py
+"""
+import numpy as np
+import pytest
+
+import decoders
+import synth
+
+SAMPLE_RATE = 44100
+NUM_SAMPLES = SAMPLE_RATE * 2
+
+
+def bank():
+    return synth.OscillatorBank([440, 1000], [1.0, 0.5], [0.0, 0.3], SAMPLE_RATE)
+
+
+def expected():
+    return np.concatenate(list(synth.stream_blocks(bank(), NUM_SAMPLES))) * decoders.PCM16_SCALE
+
+
+def write(tmp_path, name, chunks):
+    path = tmp_path / name
+    path.write_bytes(b''.join(chunks))
+    return str(path)
+
+
+def test_wav_round_trip(tmp_path):
+    path = write(tmp_path, 'mix.wav', synth.stream_wav(bank(), NUM_SAMPLES))
+    sample_rate, samples = decoders.decode(path)
+    assert sample_rate == SAMPLE_RATE
+    np.testing.assert_allclose(samples, expected(), atol=2)
+
+
+def test_flac_round_trip(tmp_path):
+    soundfile = pytest.importorskip('soundfile')
+    path = write(tmp_path, 'mix.flac', synth.stream_encoded(bank(), NUM_SAMPLES, 'FLAC'))
+    assert soundfile.info(path).frames == NUM_SAMPLES
+    sample_rate, samples = decoders.decode(path)
+    assert sample_rate == SAMPLE_RATE
+    np.testing.assert_allclose(samples, expected(), atol=2)
+
+
+def test_ogg_round_trip(tmp_path):
+    pytest.importorskip('soundfile')
+    path = write(tmp_path, 'mix.ogg', synth.stream_encoded(bank(), NUM_SAMPLES, 'OGG'))
+    sample_rate, samples = decoders.decode(path)
+    assert sample_rate == SAMPLE_RATE
+    # Vorbis is lossy, so only the length and overall level are compared
+    assert abs(len(samples) - NUM_SAMPLES) < 2048
+    assert np.sqrt(np.mean(samples ** 2)) == pytest.approx(np.sqrt(np.mean(expected() ** 2)), rel=0.1)